@@ -0,0 +1,255 @@
+"""Асинхронные представления частых GET-запросов для режима ASGI.
+
+Маршруты подключаются в foodgram.asgi_urls поверх обычных. Объекты
+выбираются асинхронным ORM, а в JSON превращаются теми же фильтрами,
+пагинацией, сериализаторами и api.representations, что и в синхронных
+представлениях, поэтому ответы совпадают. Шаги без асинхронного API
+(проверка фильтров, кеши, prefetch_related_objects в Django 4.2)
+выполняются через sync_to_async.
+
+Остальные методы и запросы браузерного API (параметр format или
+Accept: text/html) передаются синхронному представлению того же адреса.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.urls import resolve
+from django.utils.cache import patch_vary_headers
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from api.authentication import CachedTokenAuthentication
+from api.catalog import catalog_response
+from api.indexes import ingredient_index
+from api.recipe_cache import (aadd_user_flags, cache_detail, cache_list,
+                              get_cached_detail, get_cached_list,
+                              get_detail_key, get_list_key)
+from api.renderers import FastJSONRenderer
+from api.representations import (USER_FIELDS, get_recipe_values,
+                                 get_recipes, get_subscriptions)
+from api.serializers import (FollowReadSerializer, IngredientSerializer,
+                             RecipeReadSerializer, TagSerializer,
+                             aset_subscribed_ids)
+from api.views import CustomUserViewSet, RecipeViewSet, User
+from ingredients.models import Ingredient
+from tags.models import Tag
+
+SYNC_URLCONF = 'foodgram.urls'
+# Текст, с которым DRF отвечает на Http404 из get_object_or_404.
+NOT_FOUND_MESSAGE = 'No {} matches the given query.'
+
+
+def json_response(data, status=200, cache_status=None):
+    response = HttpResponse(
+        FastJSONRenderer().render(data),
+        status=status,
+        content_type='application/json',
+    )
+    if cache_status:
+        response['X-Cache'] = cache_status
+    return response
+
+
+def error_response(exc):
+    """Ответ на исключение DRF в том же виде, что у exception_handler."""
+    if isinstance(exc.detail, (list, dict)):
+        data = exc.detail
+    else:
+        data = {'detail': exc.detail}
+    response = json_response(data, exc.status_code)
+    if isinstance(
+        exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)
+    ):
+        response['WWW-Authenticate'] = (
+            CachedTokenAuthentication().authenticate_header(None)
+        )
+    return response
+
+
+def is_sync_request(request):
+    return (
+        request.method != 'GET'
+        or api_settings.URL_FORMAT_OVERRIDE in request.GET
+        or 'text/html' in request.headers.get('Accept', '')
+    )
+
+
+async def get_api_request(request):
+    """Запрос DRF с пользователем из токена."""
+    result = await sync_to_async(CachedTokenAuthentication().authenticate)(
+        request
+    )
+    api_request = Request(request)
+    api_request.user, api_request.auth = result or (AnonymousUser(), None)
+    return api_request
+
+
+def async_read_view(view):
+    """Выполнить GET асинхронно, остальное — синхронным представлением."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if is_sync_request(request):
+            match = resolve(request.path_info, urlconf=SYNC_URLCONF)
+            return await sync_to_async(match.func)(
+                request, *match.args, **match.kwargs
+            )
+        try:
+            response = await view(
+                await get_api_request(request), *args, **kwargs
+            )
+        except exceptions.APIException as exc:
+            response = error_response(exc)
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+    # csrf_exempt в Django 4.2 превращает корутину в обычную функцию.
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+async def aget_object(queryset, **lookup):
+    try:
+        return await queryset.aget(**lookup)
+    except queryset.model.DoesNotExist:
+        raise exceptions.NotFound(
+            NOT_FOUND_MESSAGE.format(queryset.model._meta.object_name)
+        )
+
+
+def get_cached(get_key, get, *args):
+    key = get_key(*args)
+    return key, None if key is None else get(key)
+
+
+async def get_context(view):
+    context = view.get_serializer_context()
+    await aset_subscribed_ids(context)
+    return context
+
+
+def get_recipe_view(request, action, **kwargs):
+    return RecipeViewSet(
+        request=request,
+        action=action,
+        args=(),
+        kwargs=kwargs,
+        format_kwarg=None,
+    )
+
+
+@async_read_view
+async def recipe_list(request):
+    key, data = await sync_to_async(get_cached)(
+        get_list_key, get_cached_list, request
+    )
+    if data is not None:
+        await aadd_user_flags(data, request.user)
+        return json_response(data, cache_status='HIT')
+    view = get_recipe_view(request, 'list')
+    queryset = await sync_to_async(view.filter_queryset)(view.get_queryset())
+    if settings.FAST_LIST_SERIALIZATION:
+        rows = await view.paginator.apaginate_queryset(
+            get_recipe_values(queryset), request, view
+        )
+        recipes = await sync_to_async(get_recipes)(rows, request)
+    else:
+        recipes = RecipeReadSerializer(
+            await view.paginator.apaginate_queryset(queryset, request, view),
+            many=True,
+            context=await get_context(view),
+        ).data
+    data = view.paginator.get_paginated_response(recipes).data
+    if key is None:
+        return json_response(data)
+    await sync_to_async(cache_list)(key, data)
+    return json_response(data, cache_status='MISS')
+
+
+@async_read_view
+async def recipe_detail(request, pk):
+    key, data = await sync_to_async(get_cached)(
+        get_detail_key, get_cached_detail, request, pk
+    )
+    if data is not None:
+        await aadd_user_flags(data, request.user)
+        return json_response(data, cache_status='HIT')
+    view = get_recipe_view(request, 'retrieve', pk=pk)
+    queryset = await sync_to_async(view.filter_queryset)(view.get_queryset())
+    data = RecipeReadSerializer(
+        await aget_object(queryset, pk=pk), context=await get_context(view)
+    ).data
+    if key is None:
+        return json_response(data)
+    await sync_to_async(cache_detail)(key, data)
+    return json_response(data, cache_status='MISS')
+
+
+@async_read_view
+async def ingredient_list(request):
+    name = request.query_params.get('name')
+    if name:
+        return json_response(
+            await sync_to_async(ingredient_index.search)(name)
+        )
+    return await sync_to_async(catalog_response)(
+        request, 'ingredients', Ingredient.objects.all(), IngredientSerializer
+    )
+
+
+@async_read_view
+async def ingredient_detail(request, pk):
+    return json_response(IngredientSerializer(
+        await aget_object(Ingredient.objects.all(), pk=pk)
+    ).data)
+
+
+@async_read_view
+async def tag_list(request):
+    return await sync_to_async(catalog_response)(
+        request, 'tags', Tag.objects.all(), TagSerializer
+    )
+
+
+@async_read_view
+async def tag_detail(request, pk):
+    return json_response(
+        TagSerializer(await aget_object(Tag.objects.all(), pk=pk)).data
+    )
+
+
+@async_read_view
+async def subscriptions(request):
+    if request.user.is_anonymous:
+        raise exceptions.NotAuthenticated()
+    view = CustomUserViewSet(
+        request=request,
+        action='get_subscriptions',
+        args=(),
+        kwargs={},
+        format_kwarg=None,
+    )
+    queryset = User.objects.filter(subscribers__user=request.user)
+    if settings.FAST_LIST_SERIALIZATION:
+        rows = await view.paginator.apaginate_queryset(
+            queryset.values(*USER_FIELDS, 'recipes_count'), request, view
+        )
+        authors = await sync_to_async(get_subscriptions)(
+            rows, request, view.get_limited_recipes()
+        )
+    else:
+        authors = await view.paginator.apaginate_queryset(
+            queryset, request, view
+        )
+        await sync_to_async(view.attach_limited_recipes)(authors)
+        context = {'request': request}
+        await aset_subscribed_ids(context)
+        authors = FollowReadSerializer(
+            authors, many=True, context=context
+        ).data
+    return json_response(
+        view.paginator.get_paginated_response(authors).data
+    )
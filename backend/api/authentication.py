@@ -0,0 +1,53 @@
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+from api.versions import bump_version, get_version, is_cache_shared
+
+TOKEN_CACHE = 'tokens'
+TOKEN_KEY = 'token:{}'
+AUTH_VERSION = 'auth:{}'
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе для знакомых ключей.
+
+    Пара (пользователь, токен) хранится в ограниченном LRU-кеше процесса
+    со сроком жизни. Вместе с ней запоминается версия пользователя из
+    общего кеша (см. api.versions): её меняют выход, удаление токена и
+    любое сохранение пользователя, так что запись из кеша совпадает со
+    строкой в базе, а выход или блокировка отклоняют её сразу во всех
+    процессах.
+
+    Без общего кеша (LocMemCache по умолчанию) версию пришлось бы
+    читать из базы на каждом запросе, и выигрыша нет: тогда класс
+    работает как обычный TokenAuthentication.
+    """
+
+    def authenticate_credentials(self, key):
+        if not is_cache_shared():
+            return super().authenticate_credentials(key)
+        token_cache = caches[TOKEN_CACHE]
+        cache_key = TOKEN_KEY.format(key)
+        entry = token_cache.get(cache_key)
+        if entry is None:
+            # Владелец ещё неизвестен: версию без него не прочитать.
+            user_id = super().authenticate_credentials(key)[0].pk
+        else:
+            user_id = entry[0].pk
+        # Версия читается до выборки, которая попадёт в кеш: выход или
+        # блокировка после этого момента сменят версию и отклонят запись.
+        version = get_version(AUTH_VERSION.format(user_id))
+        if entry is not None and entry[2] == version:
+            return entry[0], entry[1]
+        user, token = super().authenticate_credentials(key)
+        if user.pk == user_id:
+            token_cache.set(cache_key, (user, token, version))
+        return user, token
+
+
+def bump_auth_version(user_id):
+    """Отозвать закешированные токены пользователя после фиксации."""
+    transaction.on_commit(
+        lambda: bump_version(AUTH_VERSION.format(user_id))
+    )
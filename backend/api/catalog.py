@@ -0,0 +1,83 @@
+import gzip
+import hashlib
+import re
+import threading
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.renderers import JSONRenderer
+
+from api.versions import get_version
+from foodgram.constants import CATALOG_CACHE_TIMEOUT
+
+CATALOG_VERSION = 'catalog'
+PAYLOAD_KEY = 'catalog:{}:{}'
+
+accepts_gzip = re.compile(r'\bgzip\b').search
+
+CatalogPayload = namedtuple(
+    'CatalogPayload', ('version', 'body', 'gzipped', 'etag', 'gzip_etag')
+)
+
+_payloads = {}
+_lock = threading.Lock()
+
+
+def build_payload(version, data):
+    body = JSONRenderer().render(data)
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    return CatalogPayload(
+        version=version,
+        body=body,
+        gzipped=gzip.compress(body, mtime=0),
+        etag=f'"{digest}"',
+        gzip_etag=f'"{digest}-gzip"',
+    )
+
+
+def get_payload(name, queryset, serializer_class):
+    """Вернуть готовый ответ справочника name для текущей версии каталога.
+
+    Ответ хранится в памяти процесса и в кеше Django; версия каталога
+    общая для всех процессов и меняется при любой записи в ингредиенты
+    или теги, в том числе из load_data.
+    """
+    version = get_version(CATALOG_VERSION)
+    payload = _payloads.get(name)
+    if payload is not None and payload.version == version:
+        return payload
+    with _lock:
+        payload = _payloads.get(name)
+        if payload is None or payload.version != version:
+            key = PAYLOAD_KEY.format(name, version)
+            payload = cache.get(key)
+            if payload is None:
+                payload = build_payload(
+                    version, serializer_class(queryset, many=True).data
+                )
+                cache.set(key, payload, CATALOG_CACHE_TIMEOUT)
+            _payloads[name] = payload
+    return payload
+
+
+def catalog_response(request, name, queryset, serializer_class):
+    payload = get_payload(name, queryset, serializer_class)
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    client_etags = {
+        etag.strip().removeprefix('W/') for etag in if_none_match.split(',')
+    }
+    use_gzip = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    etag = payload.gzip_etag if use_gzip else payload.etag
+    if '*' in client_etags or etag in client_etags:
+        response = HttpResponseNotModified()
+    elif use_gzip:
+        response = HttpResponse(
+            payload.gzipped, content_type='application/json'
+        )
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(payload.body, content_type='application/json')
+    response['ETag'] = etag
+    response['Vary'] = 'Accept-Encoding'
+    return response
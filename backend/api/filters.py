@@ -1,18 +1,47 @@
+import json
+
+from django.db import connections
+from django.db.models import BooleanField, Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
 from django_filters.rest_framework import FilterSet, filters
 
-from ingredients.models import Ingredient
+from api.indexes import recipe_ingredient_index
+from api.pagination import Ranking
+from foodgram.constants import PANTRY_MIN_COVERAGE
 from recipes.models import Recipe
 from tags.models import Tag
 
+PANTRY_ORDERING = ('-pantry_coverage', 'id')
+ID_SET_SQL = {
+    'postgresql': '{} IN (SELECT unnest(%s::integer[]))',
+    'sqlite': '{} IN (SELECT value FROM json_each(%s))',
+}
 
-class IngredientFilter(FilterSet):
-    name = filters.CharFilter(
-        field_name='name',
-        lookup_expr='istartswith')
 
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+def in_id_set(queryset, ids):
+    """Условие «id из ids», где ids передаются одним параметром.
+
+    Множества из индекса бывают на десятки тысяч id. Список IN (%s, ...)
+    такой длины раздувает SQL, который отправляется дважды: для COUNT
+    и для страницы. Массив или JSON в одном параметре база разбирает
+    один раз.
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor not in ID_SET_SQL:
+        return Q(id__in=ids)
+    ids = list(ids)
+    return RawSQL(
+        ID_SET_SQL[vendor].format(
+            f'{queryset.model._meta.db_table}.'
+            f'{queryset.model._meta.pk.column}'
+        ),
+        (ids if vendor == 'postgresql' else json.dumps(ids),),
+        output_field=BooleanField(),
+    )
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    """Список чисел через запятую: ?ingredients=1,2,3."""
 
 
 class RecipeFilter(FilterSet):
@@ -20,6 +49,7 @@ class RecipeFilter(FilterSet):
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all(),
+        method='tags_filter',
         label='Tags'
     )
     is_favorited = filters.BooleanFilter(method='boolean_filter',
@@ -27,10 +57,42 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='boolean_filter',
         field_name='in_shopping_cart')
+    ingredients = NumberInFilter(
+        method='ingredients_filter', label='Ingredients'
+    )
+    exclude_ingredients = NumberInFilter(
+        method='exclude_ingredients_filter', label='Exclude ingredients'
+    )
+    pantry = NumberInFilter(method='pantry_filter', label='Pantry')
+    min_coverage = filters.NumberFilter(
+        method='min_coverage_filter', label='Minimal pantry coverage'
+    )
+    search = filters.CharFilter(method='search_filter', label='Search')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'tags',
+            'author',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'ingredients',
+            'exclude_ingredients',
+            'pantry',
+            'min_coverage',
+            'search',
+        )
+
+    def tags_filter(self, queryset, name, value):
+        # Подзапрос вместо JOIN: рецепт с несколькими выбранными тегами
+        # не дублируется, и DISTINCT по всем столбцам не нужен.
+        if not value:
+            return queryset
+        return queryset.filter(
+            id__in=Recipe.tags.through.objects.filter(
+                tag__in=value
+            ).values('recipe_id')
+        )
 
     def boolean_filter(self, queryset, name, value):
         if self.request.user.is_anonymous:
@@ -40,3 +102,92 @@ class RecipeFilter(FilterSet):
             return queryset.filter(**{f'{name}__user': self.request.user})
 
         return queryset.exclude(**{f'{name}__user': self.request.user})
+
+    def search_filter(self, queryset, name, value):
+        return queryset.search(value)
+
+    def ingredients_filter(self, queryset, name, value):
+        return queryset.filter(in_id_set(
+            queryset, recipe_ingredient_index.recipes_with_all(value)
+        ))
+
+    def exclude_ingredients_filter(self, queryset, name, value):
+        return queryset.exclude(in_id_set(
+            queryset, recipe_ingredient_index.recipes_with_any(value)
+        ))
+
+    def pantry_filter(self, queryset, name, value):
+        # Применяется в filter_queryset после остальных фильтров.
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        pantry = self.form.cleaned_data.get('pantry')
+        if pantry:
+            queryset = self.rank_by_pantry(queryset, pantry)
+        return queryset
+
+    def rank_by_pantry(self, queryset, value):
+        """Рецепты, которые можно приготовить в основном из value.
+
+        Рецепты аннотируются долей своих ингредиентов, которые есть
+        в списке, и сортируются по ней. Рецепты с одинаковой долей
+        передаются в SQL одним множеством, поэтому размер запроса
+        зависит от числа разных долей, а не от числа рецептов.
+
+        Порядок известен заранее, поэтому без поиска он передаётся
+        пагинатору в request.ranking: страница берётся из списка id,
+        и база не считает и не сортирует все подходящие рецепты.
+        """
+        min_coverage = self.form.cleaned_data.get('min_coverage')
+        if min_coverage is None:
+            min_coverage = PANTRY_MIN_COVERAGE
+        coverage = recipe_ingredient_index.coverage(
+            value, float(min_coverage)
+        )
+        if queryset.query.where:
+            # Остальные фильтры отбираются одним запросом только id.
+            coverage = {
+                recipe_id: coverage[recipe_id]
+                for recipe_id in queryset.filter(
+                    in_id_set(queryset, coverage)
+                ).values_list('id', flat=True)
+            }
+        recipes_by_coverage = {}
+        for recipe_id, recipe_coverage in coverage.items():
+            recipes_by_coverage.setdefault(recipe_coverage, []).append(
+                recipe_id
+            )
+        queryset = queryset.filter(in_id_set(queryset, coverage)).annotate(
+            pantry_coverage=Case(
+                *(
+                    When(
+                        in_id_set(queryset, recipe_ids),
+                        then=Value(recipe_coverage),
+                    )
+                    for recipe_coverage, recipe_ids
+                    in recipes_by_coverage.items()
+                ),
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+        )
+        if self.form.cleaned_data.get('search', '').strip():
+            # Порядок задаёт поиск.
+            return queryset
+        if self.request is not None:
+            self.request.ranking = Ranking(
+                PANTRY_ORDERING,
+                sorted(
+                    (
+                        (recipe_coverage, recipe_id)
+                        for recipe_id, recipe_coverage in coverage.items()
+                    ),
+                    key=lambda position: (-position[0], position[1]),
+                ),
+            )
+        return queryset.order_by(*PANTRY_ORDERING)
+
+    def min_coverage_filter(self, queryset, name, value):
+        # Значение используется в pantry_filter.
+        return queryset
@@ -0,0 +1,126 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from PIL import Image
+
+# Имя варианта, максимальный размер (ширина, высота), формат и расширение.
+VARIANTS = (
+    ('card', (600, 600), 'JPEG', 'jpg'),
+    ('thumbnail', (200, 200), 'JPEG', 'jpg'),
+    ('webp', (1200, 1200), 'WEBP', 'webp'),
+)
+VARIANTS_DIR = 'variants'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(name, variant, extension):
+    """Путь варианта: recipes/a.png -> recipes/variants/a_card.jpg."""
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(
+        directory, VARIANTS_DIR, f'{stem}_{variant}.{extension}'
+    )
+
+
+def get_variant_names(name):
+    return {
+        variant: variant_name(name, variant, extension)
+        for variant, _, _, extension in VARIANTS
+    }
+
+
+def has_variants(storage, name):
+    """Лежат ли в хранилище все варианты изображения name."""
+    return all(
+        storage.exists(variant_name)
+        for variant_name in get_variant_names(name).values()
+    )
+
+
+def generate_variants(source_path, targets):
+    """Сохранить уменьшенные копии изображения.
+
+    Выполняется в отдельном процессе, поэтому не обращается к Django.
+    Каждый файл пишется во временный и переименовывается, так что
+    существующий вариант всегда записан полностью.
+    """
+    with Image.open(source_path) as source:
+        source.load()
+        for target_path, size, image_format in targets:
+            image = source.copy()
+            image.thumbnail(size)
+            if image_format == 'JPEG' and image.mode != 'RGB':
+                image = image.convert('RGB')
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            temporary_path = f'{target_path}.tmp'
+            image.save(temporary_path, image_format)
+            os.replace(temporary_path, target_path)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+    return _executor
+
+
+def schedule_variants(field_file, on_done=None):
+    """Поставить в очередь создание вариантов изображения.
+
+    on_done вызывается без аргументов, когда варианты созданы.
+    """
+    if not field_file:
+        return
+    storage = field_file.storage
+    targets = [
+        (storage.path(name), size, image_format)
+        for name, (_, size, image_format, _) in zip(
+            get_variant_names(field_file.name).values(), VARIANTS
+        )
+    ]
+    source_path = field_file.path
+
+    def done(future):
+        # Колбэк выполняется в служебном потоке пула: его соединение
+        # с базой закрывается сразу.
+        try:
+            if future.exception() is None and on_done is not None:
+                on_done()
+        finally:
+            connections.close_all()
+
+    def submit():
+        get_executor().submit(
+            generate_variants, source_path, targets
+        ).add_done_callback(done)
+
+    def generate():
+        generate_variants(source_path, targets)
+        if on_done is not None:
+            on_done()
+
+    transaction.on_commit(
+        submit if settings.IMAGE_VARIANT_WORKERS else generate
+    )
+
+
+def delete_variants(storage, name):
+    """Удалить варианты изображения name после фиксации транзакции."""
+    if not name:
+        return
+
+    def delete():
+        for variant_name in get_variant_names(name).values():
+            storage.delete(variant_name)
+
+    transaction.on_commit(delete)
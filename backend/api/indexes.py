@@ -0,0 +1,246 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from django.db import transaction
+
+from api.catalog import CATALOG_VERSION
+from api.versions import bump_version, get_local_bumps, get_version
+from foodgram.constants import (INDEX_VERSION_CHECK_INTERVAL,
+                                INGREDIENT_SEARCH_CACHE_SIZE,
+                                INGREDIENT_SEARCH_LIMIT,
+                                INGREDIENT_SEARCH_MIN_TYPO_LENGTH)
+from ingredients.models import Ingredient
+from recipes.models import RecipeIngredient
+
+RECIPE_INGREDIENTS_VERSION = 'recipe_ingredients'
+
+
+def bounded_distance(first, second, max_distance):
+    """Расстояние Левенштейна или max_distance + 1, если оно больше."""
+    if (
+        abs(len(first) - len(second)) > max_distance
+        or sum(char not in second for char in first) > max_distance
+    ):
+        return max_distance + 1
+    previous = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, 1):
+        current = [i]
+        for j, second_char in enumerate(second, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (first_char != second_char),
+            ))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class VersionedIndex:
+    """Данные в памяти процесса, привязанные к версии набора данных.
+
+    Строятся при первом обращении и перестраиваются, когда версия
+    version_name меняется. Общая версия читается не чаще раза в
+    INDEX_VERSION_CHECK_INTERVAL секунд, чтобы запросы автодополнения не
+    ходили за ней в базу на каждое нажатие клавиши: изменения из других
+    процессов видны с этой задержкой, изменения своего процесса — сразу.
+    """
+
+    version_name = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = None
+        self._local_bumps = None
+        self._checked_at = None
+
+    def get(self):
+        local_bumps = get_local_bumps()
+        data, checked_at = self._data, self._checked_at
+        if (
+            data is not None and checked_at is not None
+            and local_bumps == self._local_bumps
+            and time.monotonic() - checked_at < INDEX_VERSION_CHECK_INTERVAL
+        ):
+            return data
+        version = get_version(self.version_name)
+        with self._lock:
+            if self._version != version:
+                self._data = self.build()
+                self._version = version
+            self._local_bumps = local_bumps
+            self._checked_at = time.monotonic()
+            return self._data
+
+    def build(self):
+        raise NotImplementedError
+
+    def clear(self):
+        """Забыть данные: следующее обращение построит их заново."""
+        with self._lock:
+            self._version = None
+            self._data = None
+            self._checked_at = None
+
+
+class IngredientIndex(VersionedIndex):
+    """Индекс названий ингредиентов для автодополнения.
+
+    Результаты ранжируются так: совпадение начала названия, вхождение
+    подстроки, названия с опечаткой в пределах одной-двух правок в начале
+    любого слова.
+    """
+
+    version_name = CATALOG_VERSION
+
+    def search(self, query, limit=INGREDIENT_SEARCH_LIMIT):
+        return list(self.get()(query.strip().casefold(), limit))
+
+    def build(self):
+        entries = sorted(
+            (ingredient['name'].casefold(), ingredient)
+            for ingredient in Ingredient.objects.values(
+                'id', 'name', 'measurement_unit'
+            )
+        )
+        keys = [key for key, _ in entries]
+        items = [item for _, item in entries]
+        word_starts = defaultdict(list)
+        for position, key in enumerate(keys):
+            offset = 0
+            for word in key.split(' '):
+                if word:
+                    word_starts[word[0]].append((position, offset))
+                offset += len(word) + 1
+
+        @lru_cache(maxsize=INGREDIENT_SEARCH_CACHE_SIZE)
+        def search(query, limit):
+            if not query:
+                return tuple(items[:limit])
+
+            matched = []
+            position = bisect_left(keys, query)
+            while (
+                position < len(keys)
+                and len(matched) < limit
+                and keys[position].startswith(query)
+            ):
+                matched.append(position)
+                position += 1
+
+            seen = set(matched)
+            if len(matched) < limit:
+                for position, key in enumerate(keys):
+                    if position not in seen and query in key:
+                        matched.append(position)
+                        seen.add(position)
+                        if len(matched) >= limit:
+                            break
+
+            if (
+                len(matched) < limit
+                and len(query) >= INGREDIENT_SEARCH_MIN_TYPO_LENGTH
+            ):
+                max_distance = 1 if len(query) < 6 else 2
+                distances = {}
+                for position, offset in word_starts.get(query[0], ()):
+                    if position in seen:
+                        continue
+                    distance = bounded_distance(
+                        query,
+                        keys[position][offset:offset + len(query)],
+                        max_distance,
+                    )
+                    rank = (distance, offset > 0, position)
+                    if distance <= max_distance and rank < distances.get(
+                        position, (max_distance + 1,)
+                    ):
+                        distances[position] = rank
+                matched.extend(sorted(
+                    distances, key=distances.get
+                )[:limit - len(matched)])
+
+            return tuple(items[position] for position in matched)
+
+        return search
+
+
+class RecipeIngredientIndex(VersionedIndex):
+    """Обратный индекс: ингредиент -> множество рецептов с ним.
+
+    Запросы по нескольким ингредиентам сводятся к операциям над
+    множествами вместо цепочки JOIN по RecipeIngredient.
+    """
+
+    version_name = RECIPE_INGREDIENTS_VERSION
+
+    def build(self):
+        recipes = defaultdict(set)
+        for ingredient_id, recipe_id in (
+            RecipeIngredient.objects.values_list('ingredient_id', 'recipe_id')
+            .order_by()
+            .iterator()
+        ):
+            recipes[ingredient_id].add(recipe_id)
+        sizes = Counter()
+        for recipe_ids in recipes.values():
+            sizes.update(recipe_ids)
+        return (
+            {
+                ingredient_id: frozenset(recipe_ids)
+                for ingredient_id, recipe_ids in recipes.items()
+            },
+            sizes,
+        )
+
+    def recipes_with_all(self, ingredient_ids):
+        """Рецепты, в которых есть все перечисленные ингредиенты."""
+        recipes, _ = self.get()
+        recipe_sets = sorted(
+            (
+                recipes.get(ingredient_id, frozenset())
+                for ingredient_id in set(ingredient_ids)
+            ),
+            key=len,
+        )
+        if not recipe_sets:
+            return frozenset()
+        return recipe_sets[0].intersection(*recipe_sets[1:])
+
+    def recipes_with_any(self, ingredient_ids):
+        """Рецепты, в которых есть хотя бы один из ингредиентов."""
+        recipes, _ = self.get()
+        return frozenset().union(*(
+            recipes.get(ingredient_id, frozenset())
+            for ingredient_id in set(ingredient_ids)
+        ))
+
+    def coverage(self, ingredient_ids, min_coverage):
+        """Доля ингредиентов рецепта, которые есть в списке.
+
+        Возвращает {id рецепта: доля} для рецептов, где доля не меньше
+        min_coverage.
+        """
+        recipes, sizes = self.get()
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(recipes.get(ingredient_id, ()))
+        return {
+            recipe_id: count / sizes[recipe_id]
+            for recipe_id, count in matched.items()
+            if count / sizes[recipe_id] >= min_coverage
+        }
+
+
+def bump_recipe_ingredients_version():
+    """Сменить версию состава рецептов после фиксации транзакции."""
+    transaction.on_commit(lambda: bump_version(RECIPE_INGREDIENTS_VERSION))
+
+
+ingredient_index = IngredientIndex()
+recipe_ingredient_index = RecipeIngredientIndex()
@@ -0,0 +1,239 @@
+import json
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from api.indexes import ingredient_index, recipe_ingredient_index
+from recipes.models import Recipe, RecipeIngredient
+from tags.models import Tag
+
+User = get_user_model()
+
+BASELINE = settings.BASE_DIR / 'explain_baseline.json'
+TABLE = re.compile(r'\bFROM "?(\w+)"?')
+
+# Имя, адрес запроса. Подстановки берутся из базы в get_params.
+ENDPOINTS = (
+    ('recipes', '/api/recipes/'),
+    ('recipes_cursor', '/api/recipes/?cursor='),
+    ('recipes_by_tag', '/api/recipes/?tags={tag}'),
+    ('recipes_by_author', '/api/recipes/?author={author}'),
+    ('recipes_favorited', '/api/recipes/?is_favorited=1'),
+    ('recipes_in_shopping_cart', '/api/recipes/?is_in_shopping_cart=1'),
+    ('recipes_search', '/api/recipes/?search={word}'),
+    ('recipes_by_ingredient', '/api/recipes/?ingredients={ingredient}'),
+    ('recipe_detail', '/api/recipes/{recipe}/'),
+    ('shopping_list', '/api/recipes/download_shopping_cart/?format=txt'),
+    ('users', '/api/users/'),
+    ('user_detail', '/api/users/{author}/'),
+    ('subscriptions', '/api/users/subscriptions/'),
+    ('ingredients', '/api/ingredients/'),
+    ('tags', '/api/tags/'),
+)
+
+
+def get_table(sql):
+    """Таблица из FROM внешнего запроса, а не из подзапросов."""
+    depth = 0
+    outer = []
+    for char in sql:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif depth == 0:
+            outer.append(char)
+    table = TABLE.search(''.join(outer)) or TABLE.search(sql)
+    return table.group(1) if table else '?'
+
+
+def sqlite_findings(cursor, sql):
+    cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+    correlated = set()
+    for node_id, parent_id, _, detail in cursor.fetchall():
+        if detail.startswith('CORRELATED') or parent_id in correlated:
+            correlated.add(node_id)
+        if 'VIRTUAL TABLE' in detail and parent_id in correlated:
+            # Полнотекстовый поиск заново для каждой строки внешнего запроса.
+            yield 'per_row_search: ' + detail.split()[1]
+        elif detail.startswith('USE TEMP B-TREE'):
+            yield 'sort: ' + detail.removeprefix('USE TEMP B-TREE ')
+        elif (
+            detail.startswith('SCAN ')
+            and ' USING ' not in detail
+            and 'VIRTUAL TABLE' not in detail
+            and detail != 'SCAN CONSTANT ROW'
+        ):
+            yield 'seq_scan: ' + detail.removeprefix('SCAN ')
+
+
+def postgresql_findings(cursor, sql):
+    cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get('Plans', ()))
+        if node['Node Type'] == 'Seq Scan':
+            yield 'seq_scan: ' + node['Relation Name']
+        elif node['Node Type'] in ('Sort', 'Incremental Sort'):
+            yield 'sort: ' + ', '.join(node['Sort Key'])
+
+
+FINDINGS = {
+    'sqlite': sqlite_findings,
+    'postgresql': postgresql_findings,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполнить EXPLAIN для запросов основных эндпоинтов и сравнить '
+        'планы с эталоном: новые последовательные сканирования и '
+        'сортировки считаются регрессией'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--baseline',
+            type=Path,
+            default=BASELINE,
+            help='JSON-файл с эталонными планами',
+        )
+        parser.add_argument(
+            '--update',
+            action='store_true',
+            help='Записать текущие планы в эталон',
+        )
+        parser.add_argument(
+            '--user',
+            help='Имя пользователя, от которого выполняются запросы',
+        )
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in FINDINGS:
+            raise CommandError(f'EXPLAIN для {vendor} не поддерживается')
+        user = self.get_user(options['user'])
+        params = self.get_params()
+        client = APIClient()
+        client.force_authenticate(user)
+
+        current = {}
+        # Ответ из кеша не обращается к базе, и его план не проверить.
+        with override_settings(
+            ALLOWED_HOSTS=['testserver'], RECIPE_RESPONSE_CACHE=False
+        ):
+            for name, url in ENDPOINTS:
+                current[name] = self.explain(
+                    client, url.format(**params), FINDINGS[vendor]
+                )
+
+        baseline_path = options['baseline']
+        baseline = {}
+        if baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text(encoding='utf-8'))
+        if options['update']:
+            baseline[vendor] = current
+            baseline_path.write_text(
+                json.dumps(baseline, ensure_ascii=False, indent=2) + '\n',
+                encoding='utf-8',
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'Эталон для {vendor} записан в {baseline_path}'
+            ))
+            return
+        if vendor not in baseline:
+            raise CommandError(
+                f'В {baseline_path} нет эталона для {vendor}, '
+                f'запустите команду с --update'
+            )
+        self.compare(baseline[vendor], current)
+
+    def get_user(self, username):
+        users = User.objects.order_by('id')
+        if username:
+            users = users.filter(username=username)
+        user = users.first()
+        if user is None:
+            raise CommandError('Пользователь не найден')
+        return user
+
+    def get_params(self):
+        recipe = Recipe.objects.order_by('id').first()
+        tag = Tag.objects.order_by('id').first()
+        recipe_ingredient = RecipeIngredient.objects.order_by('id').first()
+        if recipe is None or tag is None or recipe_ingredient is None:
+            raise CommandError(
+                'В базе нет рецептов или тегов, сначала заполните её'
+            )
+        return {
+            'author': recipe.author_id,
+            'ingredient': recipe_ingredient.ingredient_id,
+            'recipe': recipe.id,
+            'tag': tag.slug,
+            'word': recipe.name.split()[0],
+        }
+
+    def explain(self, client, url, get_findings):
+        # Справочники, версии и индексы в памяти тоже кешируются: без
+        # очистки запросы эндпоинта зависели бы от того, какие эндпоинты
+        # шли раньше.
+        cache.clear()
+        ingredient_index.clear()
+        recipe_ingredient_index.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        if response.status_code != 200:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+        findings = set()
+        explained = 0
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                sql = query['sql']
+                # Значения параметров уже подставлены в текст запроса.
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                explained += 1
+                table = get_table(sql)
+                findings.update(
+                    f'{table}: {finding}'
+                    for finding in get_findings(cursor, sql)
+                )
+        if not explained:
+            raise CommandError(f'{url}: нет запросов SELECT, план не проверен')
+        self.stdout.write(f'{url}: запросов {len(queries)}', ending='')
+        self.stdout.write(
+            f', находки: {", ".join(sorted(findings))}'
+            if findings else ''
+        )
+        return sorted(findings)
+
+    def compare(self, baseline, current):
+        regressions = []
+        for name, findings in current.items():
+            expected = set(baseline.get(name, ()))
+            for finding in findings:
+                if finding not in expected:
+                    regressions.append(f'{name}: {finding}')
+            for finding in sorted(expected - set(findings)):
+                self.stdout.write(self.style.SUCCESS(
+                    f'{name}: больше нет {finding}'
+                ))
+        if regressions:
+            raise CommandError(
+                'Новые последовательные сканирования или сортировки:\n'
+                + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Планы запросов не ухудшились'))
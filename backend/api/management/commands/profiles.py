@@ -0,0 +1,107 @@
+import io
+import pstats
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.profiling import load_profiles, prune_profiles
+
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+
+
+class Command(BaseCommand):
+    help = (
+        'Показать сохранённые профили запросов или сводку по одному из '
+        'них: самые затратные функции и SQL-запросы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'name',
+            nargs='?',
+            help='Имя профиля или его начало; без имени выводится список',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Сколько строк выводить',
+        )
+        parser.add_argument(
+            '--sort',
+            choices=SORT_KEYS,
+            default='cumulative',
+            help='Порядок функций в сводке',
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Удалить все сохранённые профили',
+        )
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Удалено профилей: {prune_profiles(0)}'
+            ))
+            return
+        profiles = load_profiles()
+        if not options['name']:
+            self.list_profiles(profiles[:options['limit']])
+            return
+        matched = [
+            profile for profile in profiles
+            if profile['name'].startswith(options['name'])
+        ]
+        if len(matched) != 1:
+            raise CommandError(
+                f'Профилей с именем {options["name"]}: {len(matched)}'
+            )
+        self.show_profile(matched[0], options['sort'], options['limit'])
+
+    @staticmethod
+    def get_path(profile, suffix):
+        return Path(settings.PROFILE_DIR) / f'{profile["name"]}{suffix}'
+
+    def list_profiles(self, profiles):
+        if not profiles:
+            self.stdout.write(f'В {settings.PROFILE_DIR} нет профилей')
+            return
+        for profile in profiles:
+            self.stdout.write(
+                f'{profile["name"]}  {profile["reason"]:9}  '
+                f'{profile["status"]}  {profile["duration_ms"]:>9} мс  '
+                f'SQL: {len(profile["queries"]):<4} '
+                f'{profile["method"]} {profile["path"]}'
+            )
+
+    def show_profile(self, profile, sort, limit):
+        self.stdout.write(
+            f'{profile["method"]} {profile["path"]} -> {profile["status"]}, '
+            f'{profile["duration_ms"]} мс, пользователь '
+            f'«{profile["user"] or "аноним"}», {profile["created"]}'
+        )
+        buffer = io.StringIO()
+        pstats.Stats(
+            str(self.get_path(profile, '.prof')), stream=buffer
+        ).strip_dirs().sort_stats(sort).print_stats(limit)
+        self.stdout.write(buffer.getvalue())
+
+        queries = defaultdict(list)
+        for query in profile['queries']:
+            queries[query['sql']].append(query['duration_ms'])
+        total = sum(sum(durations) for durations in queries.values())
+        self.stdout.write(
+            f'SQL: {len(profile["queries"])} запросов, '
+            f'{len(queries)} уникальных, {total:.2f} мс'
+        )
+        for sql, durations in sorted(
+            queries.items(), key=lambda item: -sum(item[1])
+        )[:limit]:
+            line = f'{sum(durations):9.2f} мс  x{len(durations):<4} {sql}'
+            # Один и тот же запрос много раз подряд — признак N+1.
+            self.stdout.write(
+                self.style.WARNING(line) if len(durations) > 1 else line
+            )
@@ -0,0 +1,603 @@
+import asyncio
+import contextvars
+import json
+import logging
+import math
+import queue
+import re
+import subprocess
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncRequestFactory, RequestFactory
+from django.test.utils import override_settings
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from ingredients.models import Ingredient
+from recipes.models import Recipe
+from tags.models import Tag
+
+User = get_user_model()
+
+POSTMAN_COLLECTION = (
+    settings.BASE_DIR.parent / 'postman_collection'
+    / 'foodgram.postman_collection.json'
+)
+# Запросы коллекции на запись зависят от порядка и меняют базу,
+# поэтому из неё воспроизводятся только чтения.
+POSTMAN_METHODS = ('GET', 'HEAD')
+VARIABLE = re.compile(r'{{(\w+)}}')
+PERCENTILES = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+ORDINALS = ('first', 'second', 'third', 'fourth', 'fifth')
+ASGI_URLCONF = 'foodgram.asgi_urls'
+
+# Счётчик SQL текущего запроса. В режиме ASGI запросы к базе выполняются
+# в потоках sync_to_async, куда контекст копируется вместе с переменной.
+current_sample = contextvars.ContextVar('current_sample')
+
+
+def percentile(values, fraction):
+    """Перцентиль по методу ближайшего ранга, values отсортированы."""
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(sample['latency'] for sample in samples)
+    summary = {
+        'requests': len(samples),
+        'rps': round(len(samples) / elapsed, 1),
+        'errors': sum(sample['status'] >= 500 for sample in samples),
+        'statuses': dict(sorted(Counter(
+            str(sample['status']) for sample in samples
+        ).items())),
+        'queries': round(
+            sum(sample['queries'] for sample in samples) / len(samples), 2
+        ),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+    }
+    for name, fraction in PERCENTILES:
+        summary[f'{name}_ms'] = round(
+            percentile(latencies, fraction) * 1000, 2
+        )
+    return summary
+
+
+def get_endpoint(method, path):
+    """Имя эндпоинта без конкретных id: метод и имя маршрута."""
+    try:
+        match = resolve(urlsplit(path).path)
+    except Resolver404:
+        return f'{method} {urlsplit(path).path}'
+    return f'{method} {match.view_name}'
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True,
+            check=True,
+            cwd=settings.BASE_DIR,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class DatabaseDelay:
+    """Обёртка запросов к базе: счётчик SQL и искусственная задержка.
+
+    Ставится на каждое подключение, в том числе открытое позже в другом
+    потоке, и снимается по завершении прогона.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def __call__(self, execute, sql, params, many, context):
+        sample = current_sample.get(None)
+        if sample is not None:
+            sample['queries'] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        for alias_connection in connections.all(initialized_only=True):
+            self.install(alias_connection)
+        connection_created.connect(self.install)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.install)
+        for alias_connection in connections.all(initialized_only=True):
+            if self in alias_connection.execute_wrappers:
+                alias_connection.execute_wrappers.remove(self)
+
+
+class Command(BaseCommand):
+    help = (
+        'Воспроизвести журнал запросов или GET-запросы коллекции Postman '
+        'против WSGI- или ASGI-приложения и вывести задержки p50/p95/p99, '
+        'запросы в секунду и число SQL-запросов по эндпоинтам. С '
+        '--db-latency видно, сколько запросов процесс держит одновременно '
+        'при медленной базе: WSGI с --workers 1 повторяет нынешний gunicorn '
+        'с одним синхронным воркером, --asgi — один воркер uvicorn'
+    )
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group()
+        source.add_argument(
+            '--log',
+            type=Path,
+            help=(
+                'Журнал в формате JSON Lines: в каждой строке method, path '
+                'и необязательные user, headers, body'
+            ),
+        )
+        source.add_argument(
+            '--postman',
+            type=Path,
+            default=POSTMAN_COLLECTION,
+            help='Коллекция Postman, используется, если журнал не указан',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help=(
+                'Число одновременных запросов: потоков для WSGI, задач '
+                'в одном цикле событий для ASGI'
+            ),
+        )
+        parser.add_argument(
+            '--asgi',
+            action='store_true',
+            help=(
+                'Отправлять запросы ASGI-приложению с асинхронными '
+                'представлениями чтения'
+            ),
+        )
+        parser.add_argument(
+            '--db-latency',
+            type=float,
+            default=0,
+            metavar='МС',
+            help='Добавить задержку к каждому запросу к базе',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=10,
+            help='Сколько раз воспроизвести весь набор запросов',
+        )
+        parser.add_argument(
+            '--user',
+            help=(
+                'Пользователь для авторизованных запросов коллекции, '
+                'по умолчанию автор с наибольшим числом рецептов'
+            ),
+        )
+        parser.add_argument(
+            '--var',
+            action='append',
+            default=[],
+            metavar='ИМЯ=ЗНАЧЕНИЕ',
+            help='Переменная коллекции Postman, можно указать несколько раз',
+        )
+        parser.add_argument(
+            '--output', type=Path, help='Сохранить результаты в JSON-файл'
+        )
+        parser.add_argument(
+            '--compare',
+            type=Path,
+            help='JSON-файл прошлого запуска для сравнения',
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['iterations'] < 1:
+            raise CommandError('Нужен минимум 1 поток и 1 итерация')
+        self.tokens = {}
+        if options['log']:
+            source = options['log']
+            requests = self.load_log(source)
+        else:
+            source = options['postman']
+            requests = self.load_postman(
+                source, options['user'], options['var']
+            )
+        if not requests:
+            raise CommandError('Нет запросов для воспроизведения')
+        if options['db_latency'] < 0:
+            raise CommandError('Задержка базы не может быть отрицательной')
+        for request in requests:
+            request['endpoint'] = get_endpoint(
+                request['method'], request['path']
+            )
+
+        test_settings = {'ALLOWED_HOSTS': ['testserver']}
+        if options['asgi']:
+            test_settings['ROOT_URLCONF'] = ASGI_URLCONF
+        self.in_flight = self.max_in_flight = 0
+        # Ответы 4xx — ожидаемая часть нагрузки, их предупреждения
+        # только засоряют вывод.
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            with override_settings(**test_settings), DatabaseDelay(
+                options['db_latency'] / 1000
+            ):
+                if options['asgi']:
+                    samples, elapsed = asyncio.run(self.run_asgi(
+                        ASGIHandler(),
+                        requests,
+                        options['workers'],
+                        options['iterations'],
+                    ))
+                else:
+                    samples, elapsed = self.run(
+                        WSGIHandler(),
+                        requests,
+                        options['workers'],
+                        options['iterations'],
+                    )
+        finally:
+            request_logger.setLevel(level)
+
+        by_endpoint = defaultdict(list)
+        for sample in samples:
+            by_endpoint[sample['endpoint']].append(sample)
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'commit': get_commit(),
+                'vendor': connection.vendor,
+                'source': str(source),
+                'interface': 'asgi' if options['asgi'] else 'wsgi',
+                'workers': options['workers'],
+                'max_in_flight': self.max_in_flight,
+                'db_latency_ms': options['db_latency'],
+                'iterations': options['iterations'],
+                'elapsed_s': round(elapsed, 3),
+            },
+            'total': summarize(samples, elapsed),
+            'endpoints': {
+                endpoint: summarize(endpoint_samples, elapsed)
+                for endpoint, endpoint_samples in sorted(by_endpoint.items())
+            },
+        }
+        previous = None
+        if options['compare']:
+            previous = json.loads(
+                options['compare'].read_text(encoding='utf-8')
+            )
+        self.print_report(report, previous)
+        if options['output']:
+            options['output'].write_text(
+                json.dumps(report, ensure_ascii=False, indent=2) + '\n',
+                encoding='utf-8',
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'Результаты записаны в {options["output"]}'
+            ))
+
+    def get_token(self, username):
+        if username not in self.tokens:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f'Пользователь {username} не найден')
+            self.tokens[username] = Token.objects.get_or_create(
+                user=user
+            )[0].key
+        return self.tokens[username]
+
+    def load_log(self, path):
+        requests = []
+        with open(path, encoding='utf-8') as file:
+            for number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    method, path = entry['method'].upper(), entry['path']
+                except (ValueError, KeyError, AttributeError) as error:
+                    raise CommandError(
+                        f'Строка {number}: неверная запись ({error})'
+                    )
+                headers = dict(entry.get('headers', {}))
+                if entry.get('user'):
+                    headers['Authorization'] = (
+                        f'Token {self.get_token(entry["user"])}'
+                    )
+                body = entry.get('body')
+                requests.append({
+                    'method': method,
+                    'path': path,
+                    'headers': headers,
+                    'body': (
+                        json.dumps(body) if isinstance(body, (dict, list))
+                        else body or ''
+                    ),
+                })
+        return requests
+
+    def load_postman(self, path, username, overrides):
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+        collection = json.loads(path.read_text(encoding='utf-8'))
+        variables = {
+            variable['key']: variable['value']
+            for variable in collection.get('variable', ())
+        }
+        variables.update(self.get_postman_variables(username))
+        variables['baseUrl'] = ''
+        for override in overrides:
+            name, separator, value = override.partition('=')
+            if not separator:
+                raise CommandError(f'Ожидается ИМЯ=ЗНАЧЕНИЕ, а не {override}')
+            variables[name] = value
+
+        requests, skipped = [], Counter()
+
+        def substitute(text):
+            missing = set(VARIABLE.findall(text)) - variables.keys()
+            if missing:
+                skipped.update(missing)
+                return None
+            return VARIABLE.sub(lambda match: variables[match[1]], text)
+
+        def walk(items, auth):
+            for item in items:
+                item_auth = item.get('auth', auth)
+                if 'item' in item:
+                    walk(item['item'], item_auth)
+                    continue
+                request = item['request']
+                if request['method'] not in POSTMAN_METHODS:
+                    continue
+                url = request['url']
+                url = substitute(url['raw'] if isinstance(url, dict) else url)
+                headers = {}
+                for header in request.get('header', ()):
+                    if not header.get('disabled'):
+                        headers[header['key']] = header['value']
+                request_auth = request.get('auth', item_auth) or {}
+                if request_auth.get('type') == 'apikey':
+                    fields = {
+                        field['key']: field['value']
+                        for field in request_auth['apikey']
+                    }
+                    headers[fields['key']] = fields['value']
+                headers = {
+                    key: substitute(value) for key, value in headers.items()
+                }
+                if url is None or None in headers.values():
+                    continue
+                requests.append({
+                    'method': request['method'],
+                    'path': quote(url, safe='/?&=:%+,'),
+                    'headers': headers,
+                    'body': '',
+                })
+
+        walk(collection['item'], collection.get('auth'))
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                'Пропущены запросы с неизвестными переменными: '
+                + ', '.join(sorted(skipped))
+            ))
+        return requests
+
+    def get_postman_variables(self, username):
+        """Значения переменных коллекции, которые задают её тесты."""
+        variables = {}
+        users = list(
+            User.objects.exclude(username=username)
+            .order_by('-recipes_count', 'id')[:3]
+        )
+        if username:
+            users.insert(0, User.objects.filter(username=username).first())
+            if users[0] is None:
+                raise CommandError(f'Пользователь {username} не найден')
+        for ordinal, user in zip(('', 'second', 'third'), users):
+            name = f'{ordinal}User' if ordinal else 'user'
+            variables[f'{name}Id'] = str(user.id)
+            variables[f'{name}Token'] = self.get_token(user.username)
+        recipe_ids = Recipe.objects.order_by('id').values_list(
+            'id', flat=True
+        )[:len(ORDINALS)]
+        for ordinal, recipe_id in zip(ORDINALS, recipe_ids):
+            variables[f'{ordinal}RecipeId'] = str(recipe_id)
+        for ordinal, (tag_id, slug) in zip(
+            ORDINALS,
+            Tag.objects.order_by('id').values_list('id', 'slug')[
+                :len(ORDINALS)
+            ],
+        ):
+            variables[f'{ordinal}TagId'] = str(tag_id)
+            variables[f'{ordinal}TagSlug'] = slug
+        ingredient = Ingredient.objects.order_by('id').first()
+        if ingredient is not None:
+            # Имена с опечатками взяты из коллекции как есть.
+            variables['firstIndredientId'] = str(ingredient.id)
+            variables['ingredientNameFirstLatter'] = ingredient.name[0]
+        return variables
+
+    def start_sample(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        sample = {
+            'endpoint': request['endpoint'],
+            'status': None,
+            'latency': time.perf_counter(),
+            'queries': 0,
+        }
+        current_sample.set(sample)
+        return sample
+
+    def finish_sample(self, sample):
+        self.in_flight -= 1
+        sample['latency'] = time.perf_counter() - sample['latency']
+        return sample
+
+    def send(self, handler, request):
+        environ = RequestFactory().generic(
+            request['method'],
+            request['path'],
+            data=request['body'],
+            content_type='application/json',
+            headers=request['headers'],
+        ).environ
+        with self.lock:
+            sample = self.start_sample(request)
+
+        def start_response(status, headers, exc_info=None):
+            sample['status'] = int(status.split()[0])
+
+        response = handler(environ, start_response)
+        try:
+            for _ in response:
+                pass
+        finally:
+            response.close()
+        with self.lock:
+            return self.finish_sample(sample)
+
+    async def asend(self, handler, request):
+        scope = AsyncRequestFactory().generic(
+            request['method'],
+            request['path'],
+            content_type='application/json',
+            headers=request['headers'],
+        ).scope
+        messages = deque([{
+            'type': 'http.request',
+            'body': request['body'].encode(),
+            'more_body': False,
+        }])
+        sample = self.start_sample(request)
+
+        async def receive():
+            return messages.popleft()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                sample['status'] = message['status']
+
+        await handler(scope, receive, send)
+        return self.finish_sample(sample)
+
+    def run(self, handler, requests, workers, iterations):
+        self.lock = threading.Lock()
+        for request in requests:
+            self.send(handler, request)
+        self.max_in_flight = 0
+        jobs = queue.SimpleQueue()
+        for _ in range(iterations):
+            for request in requests:
+                jobs.put(request)
+        samples = []
+
+        def work():
+            # У каждого потока своё подключение к базе.
+            thread_samples = []
+            try:
+                while True:
+                    try:
+                        request = jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                    thread_samples.append(self.send(handler, request))
+            finally:
+                connection.close()
+            with self.lock:
+                samples.extend(thread_samples)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(workers) as pool:
+            for future in [pool.submit(work) for _ in range(workers)]:
+                future.result()
+        return samples, time.perf_counter() - started
+
+    async def run_asgi(self, handler, requests, workers, iterations):
+        """Прогон в одном цикле событий, как у воркера uvicorn."""
+        for request in requests:
+            await self.asend(handler, request)
+        self.max_in_flight = 0
+        jobs = deque(
+            request for _ in range(iterations) for request in requests
+        )
+        samples = []
+
+        async def work():
+            while jobs:
+                samples.append(await self.asend(handler, jobs.popleft()))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(work() for _ in range(workers)))
+        return samples, time.perf_counter() - started
+
+    def print_report(self, report, previous=None):
+        columns = ('requests', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries')
+        rows = [('total', report['total'])] + list(
+            report['endpoints'].items()
+        )
+        width = max(len(name) for name, _ in rows)
+        meta = report['meta']
+        self.stdout.write(
+            f'{meta["interface"].upper()}, одновременно до '
+            f'{meta["max_in_flight"]} запросов, задержка базы '
+            f'{meta["db_latency_ms"]} мс'
+        )
+        self.stdout.write(
+            'эндпоинт'.ljust(width)
+            + ''.join(column.rjust(10) for column in columns)
+        )
+        for name, summary in rows:
+            self.stdout.write(
+                name.ljust(width)
+                + ''.join(str(summary[column]).rjust(10) for column in columns)
+            )
+            if summary['errors']:
+                self.stdout.write(self.style.ERROR(
+                    f'{name}: ответов 5xx {summary["errors"]}'
+                ))
+        if previous is None:
+            return
+        self.stdout.write(
+            f'Сравнение с {previous["meta"].get("commit") or "прошлым"} '
+            f'запуском (p95, rps):'
+        )
+        old_rows = dict(
+            [('total', previous['total'])] + list(
+                previous['endpoints'].items()
+            )
+        )
+        for name, summary in rows:
+            if name not in old_rows:
+                continue
+            old = old_rows[name]
+            changes = []
+            for column in ('p95_ms', 'rps'):
+                if old[column]:
+                    change = (summary[column] / old[column] - 1) * 100
+                    changes.append(f'{column} {change:+.1f}%')
+            self.stdout.write(f'{name}: {", ".join(changes)}')
@@ -0,0 +1,169 @@
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from api.profiling import RequestProfile
+
+logger = logging.getLogger(__name__)
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+
+class RequestTiming:
+    """Время запроса по фазам и время, проведённое в базе."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db = 0.0
+        self.queries = 0
+        self.marks = {}
+
+    def count_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+    def mark(self, name):
+        self.marks[name] = (time.perf_counter(), self.db)
+
+    def between(self, start, end):
+        """Время между отметками без учёта запросов к базе."""
+        if start not in self.marks or end not in self.marks:
+            return None
+        (started, db_started), (ended, db_ended) = (
+            self.marks[start], self.marks[end]
+        )
+        return (ended - started) - (db_ended - db_started)
+
+    def metrics(self):
+        """Фазы в секундах: None, если фаза не выполнялась."""
+        return {
+            'total': self.marks['finished'][0] - self.started,
+            'db': self.db,
+            'serialize': self.between('view', 'view_finished'),
+            'render': self.between('view_finished', 'rendered'),
+        }
+
+
+class ServerTimingMiddleware:
+    """Заголовок Server-Timing и строка журнала с фазами запроса.
+
+    serialize — время представления без запросов к базе, у DRF это в
+    основном работа сериализаторов; render — время рендерера. Запросы
+    и время потоковых ответов после отдачи заголовков не учитываются.
+    Стоит первой в MIDDLEWARE, чтобы total включал весь стек. Заголовок
+    по умолчанию включён только при DEBUG (настройка SERVER_TIMING).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (settings.SERVER_TIMING or settings.SERVER_TIMING_LOG):
+            return self.get_response(request)
+        timing = request.timing = RequestTiming()
+        with connection.execute_wrapper(timing.count_query):
+            response = self.get_response(request)
+        timing.mark('finished')
+        metrics = {
+            name: round(value * 1000, 2)
+            for name, value in timing.metrics().items()
+            if value is not None
+        }
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = ', '.join(
+                f'{name};dur={value}'
+                + (f';desc="SQL: {timing.queries}"' if name == 'db' else '')
+                for name, value in metrics.items()
+            )
+        if settings.SERVER_TIMING_LOG:
+            logger.info(json.dumps({
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'queries': timing.queries,
+                **{f'{name}_ms': value for name, value in metrics.items()},
+            }, ensure_ascii=False))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, 'timing'):
+            request.timing.mark('view')
+
+    def process_template_response(self, request, response):
+        if hasattr(request, 'timing'):
+            request.timing.mark('view_finished')
+            response.add_post_render_callback(
+                lambda response: request.timing.mark('rendered')
+            )
+        return response
+
+
+class ProfilingMiddleware:
+    """Профилирование запроса по требованию сотрудника или выборочно.
+
+    Сотрудник (или любой пользователь при DEBUG) включает профиль
+    заголовком X-Profile: 1 или параметром ?profile=1 (подходят и true,
+    yes, on; 0 и false профиль не включают) и получает имя профиля в
+    заголовке X-Profile-Id. Кроме того, доля PROFILE_SAMPLE_RATE всех
+    запросов профилируется случайно.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reason = self.get_reason(request)
+        if reason is None:
+            return self.get_response(request)
+        profile = RequestProfile(request, reason)
+        with profile:
+            response = self.get_response(request)
+        profile.status = response.status_code
+        if reason == 'requested':
+            response['X-Profile-Id'] = profile.name
+        if response.streaming:
+            response.streaming_content = profile.stream(
+                response.streaming_content
+            )
+        else:
+            profile.save()
+        return response
+
+    def get_reason(self, request):
+        if any(
+            value.strip().lower() in TRUE_VALUES
+            for value in (
+                request.headers.get('X-Profile', ''),
+                request.GET.get('profile', ''),
+            )
+        ):
+            if settings.DEBUG or self.is_staff(request):
+                return 'requested'
+        if random.random() < settings.PROFILE_SAMPLE_RATE:
+            return 'sampled'
+        return None
+
+    @staticmethod
+    def is_staff(request):
+        """Сотрудник по сессии или по токену API."""
+        if request.user.is_staff:
+            return True
+        for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+            try:
+                result = authentication().authenticate(Request(request))
+            except APIException:
+                return False
+            if result is not None:
+                return result[0].is_staff
+        return False
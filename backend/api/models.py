@@ -0,0 +1,19 @@
+from django.db import models
+
+from foodgram.constants import MAX_VERSION_NAME_LENGTH
+
+
+class Version(models.Model):
+    """Версия набора данных, общая для всех процессов сервера."""
+
+    name = models.CharField(
+        'Набор данных', max_length=MAX_VERSION_NAME_LENGTH, primary_key=True
+    )
+    value = models.BigIntegerField('Версия')
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
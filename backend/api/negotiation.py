@@ -0,0 +1,17 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class FormatContentNegotiation(DefaultContentNegotiation):
+    """Выбирать рендерер только по параметру format, без учёта Accept.
+
+    Без параметра используется первый рендерер из списка, поэтому ссылки
+    на скачивание работают с любым заголовком Accept. Неизвестный формат
+    даёт 404.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format_query_param = self.settings.URL_FORMAT_OVERRIDE
+        format = format_suffix or request.query_params.get(format_query_param)
+        if format:
+            renderers = self.filter_renderers(renderers, format)
+        return renderers[0], renderers[0].media_type
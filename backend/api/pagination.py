@@ -1,8 +1,219 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+from bisect import bisect_right
+from functools import partial
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 from foodgram import constants
 
 
+class Ranking:
+    """Порядок выдачи, посчитанный фильтром в памяти.
+
+    Фильтр кладёт его в request.ranking. Пагинаторы тогда берут страницу
+    из списка id, а из базы выбирают только её объекты: без COUNT(*)
+    и без сортировки всех подходящих строк. positions — значения полей
+    ordering для каждого объекта в порядке выдачи; поля числовые,
+    последнее — id.
+    """
+
+    def __init__(self, ordering, positions):
+        self.ordering = ordering
+        self.positions = positions
+        self.ids = [position[-1] for position in positions]
+
+    @cached_property
+    def keys(self):
+        return [self.get_key(position) for position in self.positions]
+
+    def get_key(self, position):
+        return tuple(
+            -value if field.startswith('-') else value
+            for field, value in zip(self.ordering, position)
+        )
+
+    def get_ids_after(self, position, count):
+        """Первые count id после курсора position или с начала выдачи."""
+        start = 0
+        if position is not None:
+            start = bisect_right(self.keys, self.get_key(position))
+        return self.ids[start:start + count]
+
+
+def get_ranking(request):
+    return getattr(request, 'ranking', None)
+
+
+class KeysetPagination(BasePagination):
+    """Постраничная выдача по курсору без COUNT(*) и OFFSET.
+
+    Курсор хранит значения полей сортировки последнего объекта страницы,
+    поэтому каждая следующая страница выбирается по индексу так же быстро,
+    как первая. Поля сортировки берутся из атрибута keyset_ordering
+    представления; последним полем должен быть уникальный ключ.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = constants.PAGE_SIZE
+    ordering = ('-id',)
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        results = list(self.get_page_queryset(queryset, request, view))
+        return self.set_page(results)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        results = [
+            obj
+            async for obj in self.get_page_queryset(queryset, request, view)
+        ]
+        return self.set_page(results)
+
+    def get_page_queryset(self, queryset, request, view):
+        """Запрос страницы с одним лишним объектом для признака has_next."""
+        self.request = request
+        self.ordering = getattr(view, 'keyset_ordering', self.ordering)
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        ranking = get_ranking(request)
+        if ranking is not None and ranking.ordering == tuple(self.ordering):
+            return queryset.filter(
+                id__in=ranking.get_ids_after(position, self.page_size + 1)
+            )
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    def get_position_filter(self, position):
+        position_filter = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            position_filter |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return position_filter
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(
+            self.ordering
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, instance):
+        """Курсор после instance — объекта модели или строки values()."""
+        get = (
+            instance.get if isinstance(instance, dict)
+            else partial(getattr, instance)
+        )
+        position = [get(field.lstrip('-')) for field in self.ordering]
+        return base64.urlsafe_b64encode(
+            json.dumps(position, ensure_ascii=False).encode()
+        ).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            remove_query_param(self.request.build_absolute_uri(), 'page'),
+            self.cursor_query_param,
+            self.encode_cursor(self.page[-1]),
+        )
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+
 class CustomLimitPagination(PageNumberPagination):
+    """Постраничная выдача по номеру страницы.
+
+    Если в запросе есть параметр cursor (в том числе пустой), выдача
+    переключается на KeysetPagination.
+    """
+
     page_size_query_param = 'limit'
     page_size = constants.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        ranking = get_ranking(request)
+        if ranking is None:
+            return super().paginate_queryset(queryset, request, view)
+        if super().paginate_queryset(ranking.ids, request, view) is None:
+            return None
+        self.page.object_list = list(
+            queryset.filter(id__in=self.page.object_list)
+        )
+        return list(self.page)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset для асинхронных представлений."""
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination()
+            return await self.keyset.apaginate_queryset(
+                queryset, request, view
+            )
+        self.keyset = None
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        ranking = get_ranking(request)
+        if ranking is None:
+            paginator = self.django_paginator_class(queryset, page_size)
+            # count у Paginator — cached_property: считаем его заранее,
+            # чтобы проверка номера страницы не обращалась к базе
+            # синхронно.
+            paginator.count = await queryset.acount()
+        else:
+            paginator = self.django_paginator_class(ranking.ids, page_size)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            ))
+        object_list = self.page.object_list
+        if ranking is not None:
+            object_list = queryset.filter(id__in=object_list)
+        self.page.object_list = [obj async for obj in object_list]
+        self.request = request
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,40 @@
+import json
+
+from django.utils.datastructures import MultiValueDict
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """multipart/form-data, в котором вложенные поля переданы как JSON.
+
+    Позволяет отправить рецепт с картинкой файлом, а не base64-строкой.
+    Поля-списки (list_fields) передаются JSON-массивом или повторяющимися
+    полями, в том числе одним полем: значения всегда собираются через
+    getlist(). Данные возвращаются как MultiValueDict, и Request сам
+    добавляет к ним файлы.
+    """
+
+    list_fields = ('ingredients', 'tags')
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parsed = super().parse(stream, media_type, parser_context)
+        data = MultiValueDict()
+        for key, values in parsed.data.lists():
+            if key in self.list_fields:
+                values = [
+                    item
+                    for value in values
+                    for item in self.decode_items(value)
+                ]
+            data.setlist(key, values)
+        return DataAndFiles(data, parsed.files)
+
+    @staticmethod
+    def decode_items(value):
+        """Элементы списка из одного значения поля."""
+        if value[:1] in ('[', '{'):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        return value if isinstance(value, list) else [value]
@@ -0,0 +1,132 @@
+"""Профилирование отдельных запросов: cProfile и выполненный SQL.
+
+Каждый профиль — пара файлов в settings.PROFILE_DIR с общим именем:
+<имя>.prof для pstats и <имя>.json с описанием запроса и его SQL.
+SQL сохраняется шаблоном без параметров: в них бывают токены, почта
+и пароли. Хранятся только settings.PROFILE_MAX_COUNT последних профилей.
+"""
+import cProfile
+import json
+import re
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+SUFFIXES = ('.prof', '.json')
+SLUG = re.compile(r'[^\w]+')
+
+
+class RequestProfile:
+    """Профиль одного запроса, который можно включать по частям.
+
+    Потоковый ответ формируется после выхода из middleware, поэтому
+    профиль включается заново на время выдачи каждой его части.
+    """
+
+    def __init__(self, request, reason):
+        self.request = request
+        self.reason = reason
+        self.profiler = cProfile.Profile()
+        self.queries = []
+        self.status = None
+        self.created = timezone.now()
+        self.started = time.perf_counter()
+        self.name = '{}-{}-{}'.format(
+            self.created.strftime('%Y%m%d-%H%M%S-%f'),
+            SLUG.sub('-', request.path).strip('-')[:60],
+            uuid.uuid4().hex[:6],
+        )
+
+    def __enter__(self):
+        connection.execute_wrappers.append(self.record_query)
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        connection.execute_wrappers.remove(self.record_query)
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'duration_ms': round(
+                    (time.perf_counter() - started) * 1000, 3
+                ),
+            })
+
+    def stream(self, content):
+        """Отдать части потокового ответа под профилем и сохранить его."""
+        iterator = iter(content)
+        try:
+            while True:
+                with self:
+                    chunk = next(iterator, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self.save()
+
+    def save(self):
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.profiler.dump_stats(directory / f'{self.name}.prof')
+        user = getattr(self.request, 'user', None)
+        meta = {
+            'name': self.name,
+            'created': self.created.isoformat(),
+            'reason': self.reason,
+            'method': self.request.method,
+            'path': self.request.get_full_path(),
+            'user': user.get_username() if user else None,
+            'status': self.status,
+            'duration_ms': round(
+                (time.perf_counter() - self.started) * 1000, 2
+            ),
+            'queries': self.queries,
+        }
+        (directory / f'{self.name}.json').write_text(
+            json.dumps(meta, ensure_ascii=False, indent=2),
+            encoding='utf-8',
+        )
+        prune_profiles(settings.PROFILE_MAX_COUNT)
+
+
+def prune_profiles(keep):
+    """Удалить профили, кроме keep последних; вернуть число удалённых."""
+    directory = Path(settings.PROFILE_DIR)
+    if not directory.exists():
+        return 0
+    # Имя профиля начинается с даты, поэтому сортировка по имени
+    # совпадает с сортировкой по времени.
+    names = sorted(
+        {
+            path.stem
+            for suffix in SUFFIXES
+            for path in directory.glob(f'*{suffix}')
+        },
+        reverse=True,
+    )
+    for name in names[keep:]:
+        for suffix in SUFFIXES:
+            (directory / f'{name}{suffix}').unlink(missing_ok=True)
+    return len(names[keep:])
+
+
+def load_profiles():
+    """Описания сохранённых профилей, новые первыми."""
+    directory = Path(settings.PROFILE_DIR)
+    if not directory.exists():
+        return []
+    return [
+        json.loads(path.read_text(encoding='utf-8'))
+        for path in sorted(directory.glob('*.json'), reverse=True)
+    ]
@@ -0,0 +1,227 @@
+"""Кеш ответов списка и карточки рецепта.
+
+В кеше лежит тело ответа для анонимного пользователя. Флаги текущего
+пользователя (is_favorited, is_in_shopping_cart, author.is_subscribed)
+накладываются на копию тела одним запросом. Ключи содержат версии:
+коллекции рецептов и каталога для списка, рецепта — для карточки; версия
+автора карточки хранится в записи и проверяется при чтении.
+"""
+import copy
+import hashlib
+from collections import defaultdict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Value
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.catalog import CATALOG_VERSION
+from api.versions import bump_version, get_version
+from foodgram.constants import RECIPE_CACHE_TIMEOUT
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+RECIPES_VERSION = 'recipes'
+RECIPE_VERSION = 'recipe:{}'
+USER_VERSION = 'user:{}'
+LIST_KEY = 'recipes:list:{}:{}:{}'
+DETAIL_KEY = 'recipes:detail:{}:{}:{}:{}'
+# Состав выдачи с этими фильтрами зависит от пользователя.
+USER_FILTERS = ('is_favorited', 'is_in_shopping_cart')
+
+
+def get_recipes(data):
+    return data['results'] if 'results' in data else [data]
+
+
+def clear_user_flags(data):
+    for recipe in get_recipes(data):
+        recipe['is_favorited'] = False
+        recipe['is_in_shopping_cart'] = False
+        recipe['author']['is_subscribed'] = False
+
+
+def get_user_flags(user, recipes):
+    """Запрос пар (флаг, id) для рецептов и авторов, связанных с user."""
+    recipe_ids = [recipe['id'] for recipe in recipes]
+    return (
+        Favorite.objects.filter(user=user, recipe_id__in=recipe_ids)
+        .order_by()
+        .values_list(Value('is_favorited'), 'recipe_id')
+        .union(
+            ShoppingCart.objects.filter(user=user, recipe_id__in=recipe_ids)
+            .order_by()
+            .values_list(Value('is_in_shopping_cart'), 'recipe_id'),
+            Subscription.objects.filter(
+                user=user,
+                subscribed_user_id__in={
+                    recipe['author']['id'] for recipe in recipes
+                },
+            )
+            .order_by()
+            .values_list(Value('is_subscribed'), 'subscribed_user_id'),
+            all=True,
+        )
+    )
+
+
+def set_user_flags(recipes, rows):
+    flags = defaultdict(set)
+    for kind, object_id in rows:
+        flags[kind].add(object_id)
+    for recipe in recipes:
+        recipe['is_favorited'] = recipe['id'] in flags['is_favorited']
+        recipe['is_in_shopping_cart'] = (
+            recipe['id'] in flags['is_in_shopping_cart']
+        )
+        recipe['author']['is_subscribed'] = (
+            recipe['author']['id'] in flags['is_subscribed']
+        )
+
+
+def add_user_flags(data, user):
+    """Отметить рецепты и авторов, связанных с пользователем."""
+    recipes = get_recipes(data)
+    if user.is_anonymous or not recipes:
+        return
+    set_user_flags(recipes, get_user_flags(user, recipes))
+
+
+async def aadd_user_flags(data, user):
+    """add_user_flags для асинхронных представлений."""
+    recipes = get_recipes(data)
+    if user.is_anonymous or not recipes:
+        return
+    set_user_flags(
+        recipes, [row async for row in get_user_flags(user, recipes)]
+    )
+
+
+def get_params_hash(request, params=''):
+    """Отпечаток адреса: ссылки в ответе абсолютные и зависят от хоста."""
+    return hashlib.sha256(
+        f'{request.build_absolute_uri("/")}?{params}'.encode()
+    ).hexdigest()[:32]
+
+
+def get_list_key(request):
+    """Ключ списка рецептов или None, если ответ не кешируется."""
+    if not settings.RECIPE_RESPONSE_CACHE or any(
+        request.query_params.get(name) for name in USER_FILTERS
+    ):
+        return None
+    return LIST_KEY.format(
+        get_version(RECIPES_VERSION),
+        get_version(CATALOG_VERSION),
+        get_params_hash(
+            request,
+            urlencode(sorted(request.query_params.lists()), doseq=True),
+        ),
+    )
+
+
+def get_detail_key(request, pk):
+    """Ключ карточки рецепта или None, если ответ не кешируется."""
+    if not settings.RECIPE_RESPONSE_CACHE:
+        return None
+    try:
+        pk = int(pk)
+    except ValueError:
+        return None
+    return DETAIL_KEY.format(
+        pk,
+        get_params_hash(request),
+        get_version(RECIPE_VERSION.format(pk)),
+        get_version(CATALOG_VERSION),
+    )
+
+
+def get_cached_list(key):
+    return cache.get(key)
+
+
+def get_cached_detail(key):
+    entry = cache.get(key)
+    if entry is None or entry['author_version'] != get_version(
+        USER_VERSION.format(entry['author_id'])
+    ):
+        return None
+    return entry['data']
+
+
+def cache_list(key, data):
+    """Сохранить тело ответа без флагов пользователя."""
+    data = copy.deepcopy(data)
+    clear_user_flags(data)
+    cache.set(key, data, RECIPE_CACHE_TIMEOUT)
+
+
+def cache_detail(key, data):
+    data = copy.deepcopy(data)
+    clear_user_flags(data)
+    author_id = data['author']['id']
+    cache.set(
+        key,
+        {
+            'author_id': author_id,
+            'author_version': get_version(USER_VERSION.format(author_id)),
+            'data': data,
+        },
+        RECIPE_CACHE_TIMEOUT,
+    )
+
+
+def cached_response(request, key, build, get_cached, store):
+    if key is None:
+        return build()
+    data = get_cached(key)
+    if data is not None:
+        add_user_flags(data, request.user)
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+    response = build()
+    if response.status_code == status.HTTP_200_OK:
+        response['X-Cache'] = 'MISS'
+        store(key, response.data)
+    return response
+
+
+def list_response(request, build):
+    """Ответ списка рецептов из кеша или собранный build."""
+    return cached_response(
+        request, get_list_key(request), build, get_cached_list, cache_list
+    )
+
+
+def detail_response(request, pk, build):
+    """Ответ карточки рецепта из кеша или собранный build."""
+    return cached_response(
+        request,
+        get_detail_key(request, pk),
+        build,
+        get_cached_detail,
+        cache_detail,
+    )
+
+
+def bump_recipe_versions(recipe_ids):
+    """Сбросить кеш списка и карточек рецептов после фиксации транзакции."""
+    def bump():
+        bump_version(RECIPES_VERSION)
+        for recipe_id in recipe_ids:
+            bump_version(RECIPE_VERSION.format(recipe_id))
+
+    transaction.on_commit(bump)
+
+
+def bump_user_version(user_id):
+    """Сбросить кеш списка и карточек рецептов автора."""
+    def bump():
+        bump_version(RECIPES_VERSION)
+        bump_version(USER_VERSION.format(user_id))
+
+    transaction.on_commit(bump)
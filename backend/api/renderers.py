@@ -0,0 +1,174 @@
+import csv
+import io
+
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+except ImportError:
+    canvas = None
+
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 18
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с тем же результатом байт в байт.
+
+    Типы, которых orjson не знает (даты, Decimal, ленивые строки),
+    переводятся в JSON кодировщиком DRF. С отступами, без orjson и для
+    данных, которые orjson не принимает (например, целые больше 64 бит),
+    работает обычный JSONRenderer. Отличие остаётся в числах с плавающей
+    точкой в экспоненциальной записи и NaN, в ответах API их нет.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(
+                accepted_media_type, renderer_context or {}
+            ) is not None
+        ):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        try:
+            content = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        # Как и JSONRenderer, экранируем разделители строк для JavaScript.
+        return content.replace(
+            '\u2028'.encode(), b'\\u2028'
+        ).replace('\u2029'.encode(), b'\\u2029')
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок, который отдаёт документ частями.
+
+    Строки списка — словари с ключами ingredient__name,
+    ingredient__measurement_unit и sum.
+    """
+
+    charset = 'utf-8'
+
+    def stream(self, ingredients):
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            # Ошибки (например, 401) отдаём в JSON, а не в формате файла.
+            response = (renderer_context or {}).get('response')
+            if response is not None:
+                response['Content-Type'] = 'application/json'
+            return JSONRenderer().render(data)
+        return b''.join(self.stream(data))
+
+    @staticmethod
+    def format_line(ingredient):
+        return (
+            f'{ingredient["ingredient__name"]} - {ingredient["sum"]} '
+            f'({ingredient["ingredient__measurement_unit"]})'
+        )
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        separator = ''
+        for ingredient in ingredients:
+            yield f'{separator}{self.format_line(ingredient)}'.encode()
+            separator = '\n'
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('Ингредиент', 'Количество', 'Единица измерения')
+
+    def stream(self, ingredients):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # BOM нужен, чтобы Excel распознал кириллицу в UTF-8.
+        buffer.write('\ufeff')
+        writer.writerow(self.header)
+        for ingredient in ingredients:
+            writer.writerow((
+                ingredient['ingredient__name'],
+                ingredient['sum'],
+                ingredient['ingredient__measurement_unit'],
+            ))
+            if buffer.tell() >= STREAM_CHUNK_SIZE:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode()
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    title = 'Список покупок'
+
+    @staticmethod
+    def register_font():
+        if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
+            )
+
+    def stream(self, ingredients):
+        # PDF нельзя дописывать после оглавления, поэтому документ
+        # собирается целиком; его размер ограничен числом ингредиентов
+        # в каталоге, а не числом рецептов в корзине.
+        self.register_font()
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        pdf.setTitle(self.title)
+        pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE + 4)
+        pdf.drawString(PDF_MARGIN, height - PDF_MARGIN, self.title)
+        pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+        y = height - PDF_MARGIN - 2 * PDF_LINE_HEIGHT
+        for ingredient in ingredients:
+            if y < PDF_MARGIN:
+                pdf.showPage()
+                pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+                y = height - PDF_MARGIN
+            pdf.drawString(PDF_MARGIN, y, f'• {self.format_line(ingredient)}')
+            y -= PDF_LINE_HEIGHT
+        pdf.save()
+        buffer.seek(0)
+        while True:
+            chunk = buffer.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+SHOPPING_LIST_RENDERERS = [ShoppingListTextRenderer, ShoppingListCSVRenderer]
+if canvas is not None:
+    SHOPPING_LIST_RENDERERS.append(ShoppingListPDFRenderer)
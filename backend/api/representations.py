@@ -0,0 +1,173 @@
+"""Быстрая выдача списков рецептов, пользователей и подписок.
+
+Страница выбирается через .values(), связанные данные — отдельными
+запросами по id страницы, а ответ собирается из словарей без полей DRF.
+Ключи, их порядок и значения совпадают с RecipeReadSerializer,
+CustomUserSerializer и FollowReadSerializer, поэтому JSON совпадает
+байт в байт. Включается настройкой FAST_LIST_SERIALIZATION.
+"""
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+
+from api.serializers import get_image_variants, get_subscribed_ids
+from recipes.models import Recipe, RecipeIngredient
+
+User = get_user_model()
+
+USER_FIELDS = (
+    'id',
+    'username',
+    'email',
+    'first_name',
+    'last_name',
+    'avatar',
+    'avatar_variants_ready',
+)
+RECIPE_FIELDS = (
+    'id', 'name', 'image', 'image_variants_ready', 'text', 'cooking_time'
+)
+AUTHOR_FIELDS = tuple(f'author__{field}' for field in USER_FIELDS)
+SHORT_RECIPE_FIELDS = (
+    'id', 'name', 'image', 'image_variants_ready', 'cooking_time', 'author_id'
+)
+
+avatar_storage = User._meta.get_field('avatar').storage
+image_storage = Recipe._meta.get_field('image').storage
+
+
+def get_file_url(storage, name, request):
+    """Адрес файла так же, как его отдаёт ImageField сериализатора."""
+    if not name:
+        return None
+    url = storage.url(name)
+    return url if request is None else request.build_absolute_uri(url)
+
+
+def get_recipe_values(queryset):
+    """Строки рецептов с автором и аннотациями запроса (флаги, ранги)."""
+    return queryset.prefetch_related(None).values(
+        *RECIPE_FIELDS, *AUTHOR_FIELDS, *queryset.query.annotations
+    )
+
+
+def get_user(row, request, subscribed_ids, prefix=''):
+    avatar = row[f'{prefix}avatar']
+    user_id = row[f'{prefix}id']
+    return {
+        'avatar': get_file_url(avatar_storage, avatar, request),
+        'avatar_variants': (
+            get_image_variants(
+                avatar_storage,
+                avatar,
+                row[f'{prefix}avatar_variants_ready'],
+                request,
+            )
+            if avatar else None
+        ),
+        'email': row[f'{prefix}email'],
+        'first_name': row[f'{prefix}first_name'],
+        'id': user_id,
+        'is_subscribed': user_id in subscribed_ids,
+        'last_name': row[f'{prefix}last_name'],
+        'username': row[f'{prefix}username'],
+    }
+
+
+def get_recipe_image(row, request):
+    return {
+        'image': get_file_url(image_storage, row['image'], request),
+        'image_variants': (
+            get_image_variants(
+                image_storage,
+                row['image'],
+                row['image_variants_ready'],
+                request,
+            )
+            if row['image'] else None
+        ),
+    }
+
+
+def get_recipes(rows, request):
+    """Рецепты страницы rows в формате RecipeReadSerializer."""
+    recipe_ids = [row['id'] for row in rows]
+    ingredients = defaultdict(list)
+    for item in RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('ingredient__name').values(
+        'recipe_id',
+        'ingredient_id',
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'amount',
+    ):
+        ingredients[item['recipe_id']].append({
+            'id': item['ingredient_id'],
+            'name': item['ingredient__name'],
+            'measurement_unit': item['ingredient__measurement_unit'],
+            'amount': item['amount'],
+        })
+    tags = defaultdict(list)
+    for item in Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('tag__name').values(
+        'recipe_id', 'tag_id', 'tag__name', 'tag__slug'
+    ):
+        tags[item['recipe_id']].append({
+            'id': item['tag_id'],
+            'name': item['tag__name'],
+            'slug': item['tag__slug'],
+        })
+    subscribed_ids = get_subscribed_ids({'request': request}) if rows else ()
+    return [
+        {
+            'author': get_user(row, request, subscribed_ids, 'author__'),
+            'cooking_time': row['cooking_time'],
+            'id': row['id'],
+            **get_recipe_image(row, request),
+            'ingredients': ingredients[row['id']],
+            'is_favorited': row['is_favorited'],
+            'is_in_shopping_cart': row['is_in_shopping_cart'],
+            'name': row['name'],
+            'tags': tags[row['id']],
+            'text': row['text'],
+        }
+        for row in rows
+    ]
+
+
+def get_users(rows, request):
+    """Пользователи страницы rows в формате CustomUserSerializer."""
+    subscribed_ids = get_subscribed_ids({'request': request}) if rows else ()
+    return [get_user(row, request, subscribed_ids) for row in rows]
+
+
+def get_subscriptions(rows, request, recipes):
+    """Авторы страницы rows в формате FollowReadSerializer.
+
+    recipes — запрос рецептов, которые нужно показать у авторов.
+    """
+    author_recipes = defaultdict(list)
+    if rows:
+        for recipe in recipes.filter(
+            author_id__in=[row['id'] for row in rows]
+        ).values(*SHORT_RECIPE_FIELDS):
+            author_recipes[recipe['author_id']].append({
+                'id': recipe['id'],
+                'name': recipe['name'],
+                **get_recipe_image(recipe, request),
+                'cooking_time': recipe['cooking_time'],
+            })
+    subscribed_ids = get_subscribed_ids({'request': request}) if rows else ()
+    subscriptions = []
+    for row in rows:
+        user = get_user(row, request, subscribed_ids)
+        username = user.pop('username')
+        subscriptions.append({
+            **user,
+            'recipes_count': row['recipes_count'],
+            'recipes': author_recipes[row['id']],
+            'username': username,
+        })
+    return subscriptions
@@ -1,29 +1,183 @@
 import base64
 
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.files.base import ContentFile
-from django.db.models import F
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
+from PIL import Image
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-
-from foodgram.constants import MAX_PASSWORD_LENGTH, PAGE_SIZE
+from rest_framework.relations import MANY_RELATION_KWARGS
+from rest_framework.utils import html
+
+from api.images import get_variant_names
+from api.indexes import bump_recipe_ingredients_version
+from api.recipe_cache import bump_recipe_versions
+from foodgram.constants import (MAX_IMAGE_DIMENSION, MAX_IMAGE_SIZE,
+                                MAX_PASSWORD_LENGTH)
 from ingredients.models import Ingredient
-from recipes.models import Favorite, Recipe, RecipeIngredient, ShoppingCart
+from recipes.models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                            ShoppingListItem, get_recipe_amounts,
+                            prefetch_recipe_ingredients)
 from tags.models import Tag
 from users.models import Subscription
 
 User = get_user_model()
 
 
+def get_subscribed_ids(context):
+    """Вернуть id авторов, на которых подписан текущий пользователь.
+
+    Множество вычисляется один раз и сохраняется в контексте корневого
+    сериализатора, который разделяют все вложенные сериализаторы.
+    """
+    if 'subscribed_ids' not in context:
+        request = context.get('request')
+        if request is None or request.user.is_anonymous:
+            context['subscribed_ids'] = frozenset()
+        else:
+            context['subscribed_ids'] = frozenset(
+                request.user.subscriptions.order_by().values_list(
+                    'subscribed_user_id', flat=True
+                )
+            )
+    return context['subscribed_ids']
+
+
+async def aset_subscribed_ids(context):
+    """Заполнить subscribed_ids в контексте асинхронным ORM.
+
+    В асинхронном представлении сериализатор не может сам обратиться
+    к базе, поэтому множество выбирается до сериализации.
+    """
+    user = context['request'].user
+    if user.is_anonymous:
+        context['subscribed_ids'] = frozenset()
+    else:
+        context['subscribed_ids'] = frozenset([
+            subscribed_user_id
+            async for subscribed_user_id in user.subscriptions.order_by()
+            .values_list('subscribed_user_id', flat=True)
+        ])
+
+
 class Base64ImageField(serializers.ImageField):
+    """Изображение в виде data URI с base64 или файла multipart-запроса.
+
+    Размер и разрешение проверяются до полного декодирования картинки:
+    размер — по длине base64-строки или загруженного файла, разрешение —
+    по заголовку изображения.
+    """
+
+    default_error_messages = {
+        'too_large': (
+            f'Размер изображения не должен превышать '
+            f'{MAX_IMAGE_SIZE // (1024 * 1024)} МБ.'
+        ),
+        'too_big_dimensions': (
+            f'Стороны изображения не должны превышать '
+            f'{MAX_IMAGE_DIMENSION} пикселей.'
+        ),
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
+            if len(imgstr) * 3 // 4 > MAX_IMAGE_SIZE:
+                self.fail('too_large')
             ext = format.split('/')[-1]
             data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+        elif getattr(data, 'size', 0) > MAX_IMAGE_SIZE:
+            self.fail('too_large')
+        if hasattr(data, 'seek'):
+            self.check_dimensions(data)
         return super().to_internal_value(data)
 
+    def check_dimensions(self, image_file):
+        try:
+            width, height = Image.open(image_file).size
+        except Exception:
+            self.fail('invalid_image')
+        finally:
+            image_file.seek(0)
+        if max(width, height) > MAX_IMAGE_DIMENSION:
+            self.fail('too_big_dimensions')
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Список первичных ключей, который проверяется одним запросом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        queryset = child.get_queryset()
+        pks = []
+        for pk in data:
+            try:
+                pks.append(queryset.model._meta.pk.to_python(pk))
+            except DjangoValidationError:
+                child.fail('incorrect_type', data_type=type(pk).__name__)
+        objects = queryset.in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
+def get_image_variants(storage, name, ready, request=None):
+    """Ссылки на варианты изображения name из хранилища storage.
+
+    Адреса строятся по имени без обращения к хранилищу. Пока варианты
+    не созданы (ready ложно), вместо них отдаётся оригинал.
+    """
+    variants = {}
+    for variant, variant_name in get_variant_names(name).items():
+        url = storage.url(variant_name if ready else name)
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        variants[variant] = url
+    return variants
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения.
+
+    Готовность копий хранится в поле <source>_variants_ready модели.
+    """
+
+    def get_attribute(self, instance):
+        return (
+            super().get_attribute(instance),
+            getattr(instance, f'{self.source}_variants_ready'),
+        )
+
+    def to_representation(self, value):
+        field_file, ready = value
+        if not field_file:
+            return None
+        return get_image_variants(
+            field_file.storage,
+            field_file.name,
+            ready,
+            self.context.get('request'),
+        )
+
 
 class AvatarSerializer(serializers.ModelSerializer):
     avatar = Base64ImageField(allow_null=True)
@@ -53,12 +207,14 @@ class CustomUserCreateSerializer(UserCreateSerializer):
 
 class CustomUserSerializer(UserSerializer):
     avatar = Base64ImageField(required=False, allow_null=True)
+    avatar_variants = ImageVariantsField(source='avatar')
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = (
             'avatar',
+            'avatar_variants',
             'email',
             'first_name',
             'id',
@@ -69,10 +225,7 @@ class CustomUserSerializer(UserSerializer):
         read_only_fields = ('id', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return request.user.subscriptions.filter(subscribed_user=obj).exists()
+        return obj.id in get_subscribed_ids(self.context)
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -117,15 +270,28 @@ class FollowCreateSerializer(serializers.ModelSerializer):
         return data
 
 
+class ShortRecipeSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField(source='image')
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
 class FollowReadSerializer(serializers.ModelSerializer):
+    avatar_variants = ImageVariantsField(source='avatar')
     is_subscribed = serializers.SerializerMethodField()
-    recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(default=0)
+    recipes = ShortRecipeSerializer(
+        source='limited_recipes',
+        many=True,
+        read_only=True,
+    )
 
     class Meta:
         model = User
         fields = (
             'avatar',
+            'avatar_variants',
             'email',
             'first_name',
             'id',
@@ -140,23 +306,12 @@ class FollowReadSerializer(serializers.ModelSerializer):
             'first_name',
             'id',
             'last_name',
+            'recipes_count',
             'username'
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        return Subscription.objects.filter(
-            subscribed_user=obj, user=user
-        ).exists()
-
-    def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = int(request.GET.get('recipes_limit', PAGE_SIZE))
-        return ShortRecipeSerializer(
-            Recipe.objects.filter(author=obj)[:limit],
-            many=True,
-            context={'request': request},
-        ).data
+        return obj.id in get_subscribed_ids(self.context)
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -173,27 +328,54 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'slug')
 
 
+def get_list(data, name):
+    """Значение поля-списка из JSON или из multipart-данных."""
+    if html.is_html_input(data):
+        return data.getlist(name)
+    return data.get(name)
+
+
+class MultiValueListSerializer(serializers.ListSerializer):
+    """Список объектов, который в multipart-данных лежит под одним ключом.
+
+    MultiPartJSONParser уже разобрал элементы из JSON, поэтому разбор
+    полей вида ingredients[0]id не нужен.
+    """
+
+    def get_value(self, dictionary):
+        if html.is_html_input(dictionary) and self.field_name in dictionary:
+            return dictionary.getlist(self.field_name)
+        return super().get_value(dictionary)
+
+
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField()
 
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'amount')
+        list_serializer_class = MultiValueListSerializer
 
 
 class RecipeIngredientReadSerializer(serializers.ModelSerializer):
-    ingredients = IngredientSerializer(many=True)
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
 
     class Meta:
         model = RecipeIngredient
         fields = (
+            'id',
+            'name',
+            'measurement_unit',
             'amount',
-            'ingredients'
         )
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True,
         label='Tags',
@@ -239,30 +421,41 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             )
             result.append(recipe_ingredient)
         RecipeIngredient.objects.bulk_create(result)
+        bump_recipe_ingredients_version()
+        bump_recipe_versions([recipe.id])
 
     def create_tags(self, tags, recipe):
         recipe.tags.set(tags)
 
     def to_representation(self, instance):
+        prefetch_related_objects([instance], prefetch_recipe_ingredients())
         serializer = RecipeReadSerializer(
             instance,
             context={'request': self.context.get('request')}
         )
         return serializer.data
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        instance.ingredients.clear()
+        old_amounts = get_recipe_amounts(instance.id)
         instance.tags.clear()
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.create_ingredients(ingredients, instance)
+        # Состав меняется целиком: списки покупок пересчитываются одной
+        # разницей, а не сигналом на каждую строку.
+        with ShoppingListItem.objects.paused():
+            instance.ingredients.clear()
+            RecipeIngredient.objects.filter(recipe=instance).delete()
+            self.create_ingredients(ingredients, instance)
         self.create_tags(tags, instance)
+        ShoppingListItem.objects.change_recipe(
+            instance.id, old_amounts, get_recipe_amounts(instance.id)
+        )
         return super().update(instance, validated_data)
 
     def validate(self, data):
 
-        ingredients = self.initial_data.get('ingredients')
+        ingredients = get_list(self.initial_data, 'ingredients')
         if not ingredients:
             raise serializers.ValidationError({
                 'ingredients': 'Добавьте хотя бы один ингредиент !'})
@@ -278,7 +471,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             )
         data['ingredients'] = ingredients
 
-        tags = self.initial_data.get('tags')
+        tags = get_list(self.initial_data, 'tags')
         if not tags:
             raise serializers.ValidationError({
                 'tags': 'Добавьте хотя бы один тег!'})
@@ -291,7 +484,11 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
 class RecipeReadSerializer(serializers.ModelSerializer):
     author = CustomUserSerializer()
-    ingredients = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField(source='image')
+    ingredients = RecipeIngredientReadSerializer(
+        source='recipe_ingredients',
+        many=True,
+    )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     tags = TagSerializer(many=True)
@@ -303,6 +500,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'cooking_time',
             'id',
             'image',
+            'image_variants',
             'ingredients',
             'is_favorited',
             'is_in_shopping_cart',
@@ -311,15 +509,6 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'text',
         )
 
-    def get_ingredients(self, obj):
-        ingredients = obj.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('in_recipes__amount'),
-        )
-        return ingredients
-
     def check_user_status(self, obj, model_class):
         user = self.context.get('request')
         return (
@@ -330,20 +519,19 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         )
 
     def get_is_favorited(self, obj):
-        return self.check_user_status(obj, Favorite)
+        is_favorited = getattr(obj, 'is_favorited', None)
+        if is_favorited is None:
+            return self.check_user_status(obj, Favorite)
+        return is_favorited
 
     def get_is_in_shopping_cart(self, obj):
-        return self.check_user_status(obj, ShoppingCart)
+        is_in_shopping_cart = getattr(obj, 'is_in_shopping_cart', None)
+        if is_in_shopping_cart is None:
+            return self.check_user_status(obj, ShoppingCart)
+        return is_in_shopping_cart
 
 
 class ShoppingCartSerializer(FavoriteSerializer):
 
     class Meta(FavoriteSerializer.Meta):
         model = ShoppingCart
-
-
-class ShortRecipeSerializer(serializers.ModelSerializer):
-
-    class Meta:
-        model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
@@ -0,0 +1,139 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import bump_auth_version
+from api.catalog import CATALOG_VERSION
+from api.images import delete_variants, schedule_variants
+from api.indexes import bump_recipe_ingredients_version
+from api.recipe_cache import bump_recipe_versions, bump_user_version
+from api.versions import bump_version
+from ingredients.models import Ingredient
+from recipes.models import Recipe, RecipeIngredient
+from tags.models import Tag
+
+User = get_user_model()
+
+IMAGE_FIELDS = {Recipe: 'image', User: 'avatar'}
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_catalog_version(**kwargs):
+    bump_version(CATALOG_VERSION)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def bump_recipe_ingredients(**kwargs):
+    bump_recipe_ingredients_version()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def bump_recipe_cache(instance, **kwargs):
+    bump_recipe_versions([instance.id])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def bump_recipe_ingredient_cache(instance, **kwargs):
+    bump_recipe_versions([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_cache(instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_recipe_versions([instance.id])
+    elif pk_set is not None:
+        bump_recipe_versions(pk_set)
+    else:
+        # Какие рецепты потеряли тег, после очистки уже неизвестно.
+        bump_version(CATALOG_VERSION)
+
+
+@receiver(post_save, sender=User)
+def bump_user_cache(instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        bump_user_version(instance.id)
+
+
+@receiver(post_save, sender=User)
+def revoke_cached_tokens(instance, **kwargs):
+    # Любое сохранение, включая last_login: пользователь из кеша
+    # аутентификации не должен отличаться от строки в базе, иначе его
+    # сохранение в запросе запишет устаревшие значения.
+    bump_auth_version(instance.id)
+
+
+@receiver(post_delete, sender=Token)
+def revoke_cached_token(instance, **kwargs):
+    bump_auth_version(instance.user_id)
+
+
+def mark_variants_ready(sender, pk, name):
+    """Отметить, что варианты изображения name созданы, и сбросить кеши."""
+    field = IMAGE_FIELDS[sender]
+    sender.objects.filter(pk=pk, **{field: name}).update(
+        **{f'{field}_variants_ready': True}
+    )
+    if sender is Recipe:
+        bump_recipe_versions([pk])
+    else:
+        bump_user_version(pk)
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def remember_image_name(sender, instance, update_fields=None, **kwargs):
+    """Запомнить имя изображения в базе, чтобы заметить его замену.
+
+    Сохранения без изображения в update_fields (например, last_login
+    при входе) базу не читают.
+    """
+    field = IMAGE_FIELDS[sender]
+    instance.saved_image_name = None
+    if instance._state.adding or (
+        update_fields is not None and field not in update_fields
+    ):
+        return
+    instance.saved_image_name = sender.objects.filter(
+        pk=instance.pk
+    ).values_list(field, flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def replace_image_variants(sender, instance, created, **kwargs):
+    """Создать варианты нового изображения и удалить варианты старого."""
+    field = IMAGE_FIELDS[sender]
+    field_file = getattr(instance, field)
+    saved_name = getattr(instance, 'saved_image_name', None)
+    if not created and saved_name in (None, field_file.name):
+        return
+    ready_field = f'{field}_variants_ready'
+    if getattr(instance, ready_field):
+        setattr(instance, ready_field, False)
+        sender.objects.filter(pk=instance.pk).update(**{ready_field: False})
+    delete_variants(field_file.storage, saved_name)
+    schedule_variants(
+        field_file,
+        on_done=partial(
+            mark_variants_ready, sender, instance.pk, field_file.name
+        ),
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def delete_image_variants(sender, instance, **kwargs):
+    field_file = getattr(instance, IMAGE_FIELDS[sender])
+    delete_variants(field_file.storage, field_file.name)
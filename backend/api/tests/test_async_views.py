@@ -0,0 +1,84 @@
+from asgiref.sync import async_to_sync
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+
+from api.tests.test_query_counts import QueryCountTestCase
+
+
+class AsyncViewTests(QueryCountTestCase):
+    """Асинхронные представления отвечают так же, как синхронные."""
+
+    pantry = ''
+
+    def get_urls(self):
+        self.pantry = ','.join(
+            str(ingredient.id) for ingredient in self.ingredients[:4]
+        )
+        return (
+            '/api/recipes/',
+            '/api/recipes/?limit=5&page=2',
+            '/api/recipes/?cursor=&limit=5',
+            f'/api/recipes/?tags={self.tags[0].slug}'
+            f'&author={self.authors[0].id}',
+            '/api/recipes/?is_favorited=1',
+            f'/api/recipes/?pantry={self.pantry}&limit=5&page=2',
+            f'/api/recipes/?pantry={self.pantry}&page=100',
+            '/api/recipes/?author=unknown',
+            '/api/recipes/?page=100',
+            f'/api/recipes/{self.big_recipe.id}/',
+            '/api/recipes/0/',
+            '/api/ingredients/',
+            '/api/ingredients/?name=ингредиент 1',
+            f'/api/ingredients/{self.ingredients[0].id}/',
+            '/api/tags/',
+            f'/api/tags/{self.tags[0].id}/',
+            '/api/tags/0/',
+            '/api/users/subscriptions/?recipes_limit=1',
+        )
+
+    def get_auth_headers(self, user):
+        self.authorized(user)
+        return {'Authorization': f'Token {Token.objects.get(user=user).key}'}
+
+    def request_async(self, method, *args, **kwargs):
+        async def request():
+            return await getattr(self.async_client, method)(*args, **kwargs)
+
+        with override_settings(ROOT_URLCONF='foodgram.asgi_urls'):
+            return async_to_sync(request)()
+
+    def assert_same_responses(self, async_first=False):
+        for headers in ({}, self.get_auth_headers(self.reader)):
+            for url in self.get_urls():
+                with self.subTest(url=url, headers=headers):
+                    if async_first:
+                        async_response = self.request_async(
+                            'get', url, headers=headers
+                        )
+                    response = self.client.get(url, headers=headers)
+                    if not async_first:
+                        async_response = self.request_async(
+                            'get', url, headers=headers
+                        )
+                    self.assertEqual(
+                        async_response.status_code, response.status_code
+                    )
+                    self.assertEqual(async_response.content, response.content)
+
+    @override_settings(RECIPE_RESPONSE_CACHE=False)
+    def test_same_responses(self):
+        self.assert_same_responses()
+
+    def test_same_cached_responses(self):
+        self.assert_same_responses(async_first=True)
+
+    def test_write_methods_use_sync_views(self):
+        response = self.request_async(
+            'post',
+            '/api/recipes/',
+            {},
+            content_type='application/json',
+            headers=self.get_auth_headers(self.reader),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ingredients', response.json())
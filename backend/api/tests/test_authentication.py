@@ -0,0 +1,104 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APITestCase
+
+from api import authentication
+from api.authentication import (AUTH_VERSION, TOKEN_CACHE,
+                                CachedTokenAuthentication)
+from api.models import Version
+from api.versions import bump_version
+from users.models import User
+
+CACHE_DIR = tempfile.mkdtemp()
+
+
+@override_settings(CACHES={
+    **settings.CACHES,
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_DIR,
+    },
+})
+class CachedTokenAuthenticationTests(APITestCase):
+    """Отозванный токен перестаёт приниматься сразу."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+    def setUp(self):
+        caches['default'].clear()
+        caches[TOKEN_CACHE].clear()
+        self.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password'
+        )
+        self.token = Token.objects.create(user=self.user)
+
+    def authenticate(self):
+        return CachedTokenAuthentication().authenticate_credentials(
+            self.token.key
+        )
+
+    def revoke_elsewhere(self):
+        """Выход в другом процессе: токен удалён, версия увеличена."""
+        Token.objects.filter(pk=self.token.pk).update(key='revoked')
+        bump_version(AUTH_VERSION.format(self.user.pk))
+
+    def test_revoked_in_other_process(self):
+        self.assertEqual(self.authenticate()[0], self.user)
+        with self.assertNumQueries(0):
+            self.authenticate()
+        self.revoke_elsewhere()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_revoked_during_lookup(self):
+        get_version = authentication.get_version
+
+        def get_version_then_revoke(name):
+            version = get_version(name)
+            self.revoke_elsewhere()
+            return version
+
+        with mock.patch.object(
+            authentication, 'get_version', get_version_then_revoke
+        ):
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate()
+
+    def test_fresh_after_save(self):
+        """Пользователь из кеша не отстаёт от строки в базе."""
+        self.authenticate()
+        user = User.objects.get(pk=self.user.pk)
+        user.last_login = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(update_fields=['last_login'])
+        self.assertEqual(self.authenticate()[0].last_login, user.last_login)
+
+
+class UnsharedCacheAuthenticationTests(APITestCase):
+    """Без общего кеша токен проверяется обычным запросом."""
+
+    def test_no_versions(self):
+        user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password'
+        )
+        token = Token.objects.create(user=user)
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                CachedTokenAuthentication().authenticate_credentials(
+                    token.key
+                )
+        self.assertFalse(
+            Version.objects.filter(name=AUTH_VERSION.format(user.pk))
+            .exists()
+        )
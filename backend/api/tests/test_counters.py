@@ -0,0 +1,61 @@
+from rest_framework import status
+
+from api.tests.test_query_counts import PNG, QueryCountTestCase
+from recipes.models import Favorite, Recipe
+from users.models import User
+
+
+class CounterTests(QueryCountTestCase):
+    """Сохранение объекта целиком не затирает счётчики."""
+
+    def get_recipes_count(self, user):
+        return User.objects.values_list(
+            'recipes_count', flat=True
+        ).get(pk=user.pk)
+
+    def test_avatar_after_recipe(self):
+        user = self.create_user('newcomer')
+        client = self.authorized(user)
+        response = client.post(
+            '/api/recipes/',
+            {
+                'name': 'Первый рецепт',
+                'text': 'Описание',
+                'cooking_time': 5,
+                'image': PNG,
+                'tags': [self.tags[0].id],
+                'ingredients': [{'id': self.ingredients[0].id, 'amount': 3}],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        recipe_id = response.data['id']
+        self.assertEqual(self.get_recipes_count(user), 1)
+        response = client.put(
+            '/api/users/me/avatar/', {'avatar': PNG}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_recipes_count(user), 1)
+        response = client.delete(f'/api/recipes/{recipe_id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.get_recipes_count(user), 0)
+
+    def test_recipe_save(self):
+        recipe = Recipe.objects.get(pk=self.recipes[0].pk)
+        Favorite.objects.create(user=self.fan, recipe=recipe)
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(
+            recipe.favorites_count,
+            Favorite.objects.filter(recipe=recipe).count(),
+        )
+
+    def test_drifted_counter(self):
+        recipe = self.recipes[0]
+        User.objects.filter(pk=recipe.author_id).update(recipes_count=0)
+        response = self.authorized(recipe.author).delete(
+            f'/api/recipes/{recipe.id}/'
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.get_recipes_count(recipe.author), 0)
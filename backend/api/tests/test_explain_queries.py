@@ -0,0 +1,57 @@
+import io
+import json
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import override_settings
+
+from api.management.commands.explain_queries import (ENDPOINTS, FINDINGS,
+                                                     Command)
+from api.tests.test_query_counts import QueryCountTestCase
+
+
+class ExplainQueriesTests(QueryCountTestCase):
+    """Планы снимаются с настоящих запросов, а не с ответов из кеша."""
+
+    maxDiff = None
+
+    def get_plans(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = Path(directory) / 'baseline.json'
+            call_command(
+                'explain_queries',
+                baseline=baseline,
+                update=True,
+                user=self.reader.username,
+                stdout=io.StringIO(),
+            )
+            return json.loads(baseline.read_text(encoding='utf-8'))
+
+    def test_cached_responses(self):
+        if connection.vendor not in FINDINGS:
+            self.skipTest(f'EXPLAIN для {connection.vendor} не поддерживается')
+        with override_settings(RECIPE_RESPONSE_CACHE=False):
+            expected = self.get_plans()
+        self.assertEqual(
+            set(expected[connection.vendor]), {name for name, _ in ENDPOINTS}
+        )
+        with override_settings(RECIPE_RESPONSE_CACHE=True):
+            client = self.authorized(self.reader)
+            for url in (
+                '/api/recipes/', f'/api/recipes/{self.recipes[0].id}/'
+            ):
+                client.get(url)
+            self.assertEqual(self.get_plans(), expected)
+
+    def test_no_queries(self):
+        client = SimpleNamespace(
+            get=lambda url: SimpleNamespace(status_code=200, streaming=False)
+        )
+        with self.assertRaises(CommandError):
+            Command(stdout=io.StringIO()).explain(
+                client, '/api/recipes/', FINDINGS['sqlite']
+            )
@@ -0,0 +1,80 @@
+from django.db import connection
+
+from api.tests.test_query_counts import QueryCountTestCase
+from foodgram.constants import PANTRY_MIN_COVERAGE
+from recipes.models import Recipe
+
+
+class RecipeIngredientFilterTests(QueryCountTestCase):
+    """Фильтры по ингредиентам: порядок выдачи и размер запросов."""
+
+    def get_ids(self, url):
+        """Рецепты со всех страниц выдачи, начиная с url."""
+        ids = []
+        while url:
+            data = self.anonymous.get(url).data
+            ids += [recipe['id'] for recipe in data['results']]
+            url = data['next']
+        return ids
+
+    def get_expected_pantry(self, pantry, recipes):
+        coverage = {}
+        for recipe in recipes.prefetch_related('ingredients'):
+            ingredients = {
+                ingredient.id for ingredient in recipe.ingredients.all()
+            }
+            share = len(ingredients & pantry) / len(ingredients)
+            if share >= PANTRY_MIN_COVERAGE:
+                coverage[recipe.id] = share
+        return sorted(coverage, key=lambda pk: (-coverage[pk], pk))
+
+    def test_pantry_order(self):
+        for count in (1, 3, 12):
+            pantry = {ingredient.id for ingredient in self.ingredients[:count]}
+            url = '/api/recipes/?limit=4&pantry=' + ','.join(map(str, pantry))
+            author = self.authors[0]
+            expected = self.get_expected_pantry(pantry, Recipe.objects.all())
+            for url, expected in (
+                (url, expected),
+                (url + '&cursor=', expected),
+                (
+                    f'{url}&author={author.id}',
+                    self.get_expected_pantry(
+                        pantry, Recipe.objects.filter(author=author)
+                    ),
+                ),
+            ):
+                with self.subTest(url=url):
+                    self.assertEqual(self.get_ids(url), expected)
+
+    def test_constant_params(self):
+        """Число параметров SQL не зависит от числа подходящих рецептов."""
+        def count_params(execute, sql, params, many, context):
+            counts.append(len(params or ()))
+            return execute(sql, params, many, context)
+
+        def join(ingredients):
+            return ','.join(str(ingredient.id) for ingredient in ingredients)
+
+        # Пары значений отбирают разное число рецептов; у pantry в обоих
+        # случаях две разные доли: 1 и 0,5.
+        cases = {
+            'ingredients': (self.ingredients[1:2], self.ingredients[11:]),
+            'exclude_ingredients': (
+                self.ingredients[:1], self.ingredients[1:6]
+            ),
+            'pantry': (self.ingredients[:1], self.ingredients[1:6]),
+        }
+        # Прогрев индекса ингредиентов.
+        self.anonymous.get(f'/api/recipes/?pantry={self.ingredients[0].id}')
+        for name, values in cases.items():
+            runs = []
+            for ingredients in values:
+                counts = []
+                with connection.execute_wrapper(count_params):
+                    self.anonymous.get(
+                        f'/api/recipes/?{name}={join(ingredients)}&limit=1'
+                    )
+                runs.append(counts)
+            with self.subTest(name=name):
+                self.assertEqual(runs[0], runs[1])
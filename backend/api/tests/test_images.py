@@ -0,0 +1,79 @@
+import base64
+from unittest import mock
+
+from django.contrib.auth.signals import user_logged_in
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.images import get_variant_names, has_variants
+from api.tests.test_query_counts import PNG, QueryCountTestCase
+from recipes.models import Recipe
+
+
+class ImageVariantsTests(QueryCountTestCase):
+    """Варианты создаются только для нового изображения."""
+
+    def set_image(self, recipe, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.image.save(
+                name, ContentFile(base64.b64decode(PNG.split(',')[1]))
+            )
+
+    def test_generated_on_change(self):
+        recipe = self.recipes[0]
+        self.set_image(recipe, 'first.png')
+        first = recipe.image.name
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image_variants_ready)
+        self.assertTrue(has_variants(recipe.image.storage, first))
+        self.set_image(recipe, 'second.png')
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image_variants_ready)
+        self.assertTrue(has_variants(recipe.image.storage, recipe.image.name))
+        for name in get_variant_names(first).values():
+            self.assertFalse(recipe.image.storage.exists(name))
+        name = recipe.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        for name in get_variant_names(name).values():
+            self.assertFalse(recipe.image.storage.exists(name))
+
+    @mock.patch('api.signals.schedule_variants')
+    def test_not_scheduled_without_change(self, schedule_variants):
+        recipe = self.recipes[0]
+        recipe.name = 'Новое название'
+        recipe.save()
+        with CaptureQueriesContext(connection) as queries:
+            user_logged_in.send(
+                sender=type(self.cook), request=None, user=self.cook
+            )
+        self.assertEqual(len(queries), 1)
+        schedule_variants.assert_not_called()
+
+    def test_urls_without_storage(self):
+        """Ссылки на варианты строятся без обращения к хранилищу."""
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(
+            image_variants_ready=True
+        )
+        with mock.patch.object(
+            FileSystemStorage, 'exists', side_effect=AssertionError
+        ):
+            for url in (
+                '/api/recipes/', f'/api/recipes/{self.recipes[0].id}/'
+            ):
+                with self.subTest(url=url):
+                    response = self.anonymous.get(url)
+                    data = response.data
+                    recipe = next(
+                        recipe for recipe in data.get('results', [data])
+                        if recipe['id'] == self.recipes[0].id
+                    )
+                    self.assertTrue(
+                        recipe['image_variants']['card'].endswith(
+                            get_variant_names(
+                                self.recipes[0].image.name
+                            )['card']
+                        )
+                    )
@@ -0,0 +1,93 @@
+import io
+import json
+import tempfile
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase
+
+from api.catalog import CATALOG_VERSION
+from api.indexes import ingredient_index
+from api.models import Version
+from ingredients.management.commands.load_data import iter_json_array
+from ingredients.models import Ingredient
+from tags.models import Tag
+
+
+class LoadDataInvalidationTests(APITestCase):
+    """load_data сбрасывает справочники через общую версию каталога."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Завтрак', slug='breakfast')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def setUp(self):
+        ingredient_index.clear()
+
+    def load_data(self, ingredients):
+        with tempfile.TemporaryDirectory() as data_dir:
+            data_dir = Path(data_dir)
+            (data_dir / 'ingredients.csv').write_text(
+                ''.join(f'{name},{unit}\n' for name, unit in ingredients),
+                encoding='utf-8',
+            )
+            (data_dir / 'tags.json').write_text(
+                '[{"name": "Завтрак", "slug": "breakfast"}]',
+                encoding='utf-8',
+            )
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command(
+                    'load_data', data_dir=data_dir, stdout=io.StringIO()
+                )
+
+    def get_names(self, **params):
+        return [
+            ingredient['name']
+            for ingredient in self.client.get(
+                '/api/ingredients/', params
+            ).json()
+        ]
+
+    def test_new_rows_are_served(self):
+        self.assertEqual(self.get_names(), ['соль'])
+        self.assertEqual(self.get_names(name='кар'), [])
+        version = Version.objects.get(name=CATALOG_VERSION).value
+        self.load_data((('соль', 'г'), ('кардамон', 'г')))
+        # Версия хранится в базе, её видят и другие процессы сервера.
+        self.assertNotEqual(
+            Version.objects.get(name=CATALOG_VERSION).value, version
+        )
+        self.assertEqual(self.get_names(), ['кардамон', 'соль'])
+        self.assertEqual(self.get_names(name='кар'), ['кардамон'])
+
+    def test_unchanged_catalog_keeps_version(self):
+        self.get_names()
+        version = Version.objects.get(name=CATALOG_VERSION).value
+        self.load_data((('соль', 'г'),))
+        self.assertEqual(
+            Version.objects.get(name=CATALOG_VERSION).value, version
+        )
+
+
+class JSONStreamTests(SimpleTestCase):
+    """JSON-массив читается по элементам блоками любого размера."""
+
+    def test_chunks(self):
+        text = (
+            ' [{"name": "соль [крупная], \\"йодированная\\"", '
+            '"measurement_unit": "г"},\n {"name": "вода", "amount": 250}]'
+        )
+        for chunk_size in (1, 2, 7, len(text)):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(
+                    list(iter_json_array(io.StringIO(text), chunk_size)),
+                    json.loads(text),
+                )
+
+    def test_invalid(self):
+        for text in ('', '{}', '[1,]', '[1 2]', '[1', '[1] 2'):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    list(iter_json_array(io.StringIO(text), 2))
@@ -0,0 +1,106 @@
+import base64
+import json
+import re
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework import status
+
+from api.tests.test_query_counts import PNG, QueryCountTestCase
+from foodgram.constants import MAX_REQUEST_BODY_SIZE
+from recipes.models import Recipe
+
+NGINX_CONF = settings.BASE_DIR.parent / 'infra' / 'nginx.conf'
+
+
+class MultiPartRecipeTests(QueryCountTestCase):
+    """Рецепт с картинкой-файлом в multipart/form-data."""
+
+    def post(self, **fields):
+        image = SimpleUploadedFile(
+            'image.png',
+            base64.b64decode(PNG.split(',')[1]),
+            content_type='image/png',
+        )
+        return self.authorized(self.cook).post(
+            '/api/recipes/',
+            {
+                'name': 'Из формы',
+                'text': '[не JSON]',
+                'cooking_time': 5,
+                'image': image,
+                **fields,
+            },
+            format='multipart',
+        )
+
+    def test_list_fields(self):
+        ingredient = {'id': self.ingredients[0].id, 'amount': 3}
+        tags = [tag.id for tag in self.tags]
+        for fields, expected_tags in (
+            (
+                {
+                    'tags': str(tags[0]),
+                    'ingredients': json.dumps(ingredient),
+                },
+                tags[:1],
+            ),
+            (
+                {'tags': tags, 'ingredients': json.dumps([ingredient])},
+                tags,
+            ),
+            (
+                {
+                    'tags': json.dumps(tags[1:]),
+                    'ingredients': [json.dumps(ingredient)],
+                },
+                tags[1:],
+            ),
+        ):
+            with self.subTest(fields=fields):
+                response = self.post(**fields)
+                self.assertEqual(
+                    response.status_code, status.HTTP_201_CREATED,
+                    response.data,
+                )
+                recipe = Recipe.objects.get(pk=response.data['id'])
+                self.assertEqual(
+                    sorted(recipe.tags.values_list('id', flat=True)),
+                    expected_tags,
+                )
+                self.assertEqual(recipe.text, '[не JSON]')
+                self.assertEqual(
+                    list(recipe.recipe_ingredients.values_list(
+                        'ingredient_id', 'amount'
+                    )),
+                    [(ingredient['id'], ingredient['amount'])],
+                )
+
+    def test_missing_list_fields(self):
+        response = self.post(tags=[])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RequestBodySizeTests(QueryCountTestCase):
+    """Картинку предельного размера можно прислать в base64."""
+
+    def test_django_limit(self):
+        self.assertGreaterEqual(
+            settings.DATA_UPLOAD_MAX_MEMORY_SIZE, MAX_REQUEST_BODY_SIZE
+        )
+        image = 'data:image/png;base64,' + 'A' * (3 * 1024 * 1024)
+        response = self.authorized(self.cook).put(
+            '/api/users/me/avatar/', {'avatar': image}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('avatar', response.data)
+
+    def test_nginx_limit(self):
+        if not NGINX_CONF.exists():
+            self.skipTest('infra/nginx.conf не входит в образ')
+        size = re.search(
+            r'client_max_body_size\s+(\d+)M;', NGINX_CONF.read_text()
+        )
+        self.assertGreaterEqual(
+            int(size.group(1)) * 1024 * 1024, MAX_REQUEST_BODY_SIZE
+        )
@@ -0,0 +1,80 @@
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.test import override_settings
+from rest_framework import status
+
+from api.profiling import load_profiles
+from api.tests.test_query_counts import QueryCountTestCase
+
+
+class ProfilingTests(QueryCountTestCase):
+    """Профили по запросу: кому доступны, что и сколько хранится."""
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.settings = override_settings(
+            PROFILE_DIR=self.directory, PROFILE_MAX_COUNT=2
+        )
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.staff = self.create_user('staff')
+        self.staff.is_staff = True
+        self.staff.save()
+
+    def request_profile(self, client):
+        return client.post(
+            '/api/auth/token/login/?profile=1',
+            {'email': self.cook.email, 'password': 'password-for-tests'},
+            format='json',
+        )
+
+    def test_access(self):
+        for client, debug, profiled in (
+            (self.anonymous, False, False),
+            (self.authorized(self.reader), False, False),
+            (self.anonymous, True, True),
+            (self.authorized(self.staff), False, True),
+        ):
+            with self.subTest(client=client, debug=debug):
+                with override_settings(DEBUG=debug):
+                    response = self.request_profile(client)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual('X-Profile-Id' in response, profiled)
+
+    def test_flag_values(self):
+        client = self.authorized(self.staff)
+        for query, headers, profiled in (
+            ('?profile=0', {}, False),
+            ('?profile=false', {}, False),
+            ('', {'HTTP_X_PROFILE': 'off'}, False),
+            ('?profile=true', {}, True),
+            ('', {'HTTP_X_PROFILE': '1'}, True),
+        ):
+            with self.subTest(query=query, headers=headers):
+                response = client.get(f'/api/tags/{query}', **headers)
+                self.assertEqual('X-Profile-Id' in response, profiled)
+
+    def test_no_params(self):
+        response = self.request_profile(self.authorized(self.staff))
+        profile = (
+            Path(self.directory) / f'{response["X-Profile-Id"]}.json'
+        ).read_text(encoding='utf-8')
+        self.assertTrue(json.loads(profile)['queries'])
+        self.assertNotIn(self.cook.email, profile)
+        self.assertNotIn(response.data['auth_token'], profile)
+
+    def test_rotation(self):
+        names = [
+            self.request_profile(self.authorized(self.staff))['X-Profile-Id']
+            for _ in range(4)
+        ]
+        self.assertEqual(
+            sorted(profile['name'] for profile in load_profiles()),
+            sorted(names[-2:]),
+        )
+        self.assertEqual(len(list(Path(self.directory).iterdir())), 4)
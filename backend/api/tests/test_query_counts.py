@@ -0,0 +1,648 @@
+import shutil
+import tempfile
+from urllib.parse import quote, urlencode
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from api.authentication import CachedTokenAuthentication
+from api.indexes import ingredient_index, recipe_ingredient_index
+from ingredients.models import Ingredient
+from recipes.models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                            ShoppingListItem)
+from tags.models import Tag
+from users.models import Subscription, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+PAGE_SIZES = (1, 5, 10)
+PNG = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8/5+hHgAHggJ/PchI7wAAAABJRU5ErkJggg=='
+)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANT_WORKERS=0)
+class QueryCountTestCase(APITestCase):
+    """Число запросов к базе не должно зависеть от объёма выдачи.
+
+    Каждый маршрут выполняется для нескольких размеров страницы или
+    объёмов данных; при расхождении тест печатает SQL самого дорогого
+    варианта.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=f'Тег {i}', slug=f'tag{i}') for i in range(3)
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(12)
+        )
+        cls.authors = [cls.create_user(f'author{i}') for i in range(3)]
+        cls.reader = cls.create_user('reader')
+        cls.fan = cls.create_user('fan')
+        cls.cook = cls.create_user('cook')
+        cls.recipes = [
+            cls.create_recipe(
+                cls.authors[i % 3],
+                f'Рецепт {i:02}',
+                cls.ingredients[i % 12:i % 12 + 2],
+                cls.tags[i % 3:i % 3 + 1],
+            )
+            for i in range(24)
+        ]
+        cls.small_recipe = cls.create_recipe(
+            cls.authors[0], 'Маленький', cls.ingredients[:1], cls.tags[:1]
+        )
+        cls.big_recipe = cls.create_recipe(
+            cls.authors[0], 'Большой', cls.ingredients[:10], cls.tags
+        )
+        for recipe in cls.recipes:
+            Favorite.objects.create(user=cls.reader, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+        ShoppingCart.objects.create(user=cls.fan, recipe=cls.small_recipe)
+        ShoppingCart.objects.create(user=cls.cook, recipe=cls.big_recipe)
+        for author in cls.authors:
+            Subscription.objects.create(
+                user=cls.reader, subscribed_user=author
+            )
+        ShoppingListItem.objects.rebuild()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @staticmethod
+    def create_user(username):
+        return User.objects.create_user(
+            username=username,
+            email=f'{username}@example.com',
+            first_name=username,
+            last_name=username,
+            password='password-for-tests',
+        )
+
+    @staticmethod
+    def create_recipe(author, name, ingredients, tags):
+        recipe = Recipe.objects.create(
+            author=author,
+            name=name,
+            text=f'Описание: {name}',
+            cooking_time=10,
+            image='recipes/test.png',
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=5)
+            for ingredient in ingredients
+        )
+        recipe.tags.set(tags)
+        return recipe
+
+    def setUp(self):
+        cache.clear()
+        ingredient_index.clear()
+        recipe_ingredient_index.clear()
+        self.anonymous = APIClient()
+        self.clients = {}
+
+    def authorized(self, user):
+        if user not in self.clients:
+            client = APIClient()
+            token, _ = Token.objects.get_or_create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+            # Токен сразу попадает в кеш аутентификации, чтобы первый
+            # измеряемый запрос не отличался от остальных.
+            CachedTokenAuthentication().authenticate_credentials(token.key)
+            self.clients[user] = client
+        return self.clients[user]
+
+    def authorized_runs(self, users, make_request):
+        """Запуски make_request(client) от имени каждого из users."""
+        return [
+            (
+                user.username,
+                lambda client=self.authorized(user): make_request(client),
+            )
+            for user in users
+        ]
+
+    def assert_constant_queries(self, runs, expected_status, warm_up=True):
+        """Выполнить запросы runs и сравнить число запросов к базе.
+
+        runs — пары (название, функция без аргументов, делающая запрос).
+        Первый запрос безопасных маршрутов выполняется заранее, чтобы
+        заполнить кеши.
+        """
+        if warm_up:
+            runs[0][1]()
+        captured = []
+        for label, make_request in runs:
+            with CaptureQueriesContext(connection) as queries:
+                response = make_request()
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertEqual(
+                response.status_code,
+                expected_status,
+                f'{label}: {getattr(response, "data", response)}',
+            )
+            captured.append((label, queries.captured_queries))
+        counts = {label: len(queries) for label, queries in captured}
+        if len(set(counts.values())) > 1:
+            label, queries = max(captured, key=lambda run: len(run[1]))
+            sql = '\n'.join(
+                f'{number}. {query["sql"]}'
+                for number, query in enumerate(queries, 1)
+            )
+            self.fail(
+                f'Число запросов зависит от объёма выдачи: {counts}\n'
+                f'Запросы для «{label}»:\n{sql}'
+            )
+
+    def get_runs(self, client, url, sizes=PAGE_SIZES, param='limit'):
+        separator = '&' if '?' in url else '?'
+        return [
+            (
+                f'{url} {param}={size}',
+                lambda size=size: client.get(
+                    f'{url}{separator}{param}={quote(str(size))}'
+                ),
+            )
+            for size in sizes
+        ]
+
+
+@override_settings(RECIPE_RESPONSE_CACHE=False)
+class RecipeQueryCountTests(QueryCountTestCase):
+
+    def test_recipe_list(self):
+        for client in (self.anonymous, self.authorized(self.reader)):
+            with self.subTest(client=client):
+                self.assert_constant_queries(
+                    self.get_runs(client, '/api/recipes/'),
+                    status.HTTP_200_OK,
+                )
+
+    def test_recipe_list_cursor(self):
+        for client in (self.anonymous, self.authorized(self.reader)):
+            with self.subTest(client=client):
+                self.assert_constant_queries(
+                    self.get_runs(client, '/api/recipes/?cursor='),
+                    status.HTTP_200_OK,
+                )
+
+    def test_recipe_list_filters(self):
+        ingredient = self.ingredients[1].id
+        urls = (
+            '/api/recipes/?is_favorited=1',
+            '/api/recipes/?is_in_shopping_cart=1',
+            '/api/recipes/?tags=tag0&tags=tag1',
+            f'/api/recipes/?author={self.authors[0].id}',
+            '/api/recipes/?' + urlencode({'search': 'Рецепт'}),
+            f'/api/recipes/?ingredients={ingredient}',
+            f'/api/recipes/?exclude_ingredients={ingredient}',
+            f'/api/recipes/?pantry={ingredient},{ingredient + 1}',
+        )
+        for client in (self.anonymous, self.authorized(self.reader)):
+            for url in urls:
+                with self.subTest(client=client, url=url):
+                    self.assert_constant_queries(
+                        self.get_runs(client, url), status.HTTP_200_OK
+                    )
+
+    def test_recipe_detail(self):
+        for client in (self.anonymous, self.authorized(self.reader)):
+            with self.subTest(client=client):
+                self.assert_constant_queries(
+                    [
+                        (
+                            recipe.name,
+                            lambda recipe=recipe: client.get(
+                                f'/api/recipes/{recipe.id}/'
+                            ),
+                        )
+                        for recipe in (self.small_recipe, self.big_recipe)
+                    ],
+                    status.HTTP_200_OK,
+                )
+
+    def test_get_link(self):
+        for client in (self.anonymous, self.authorized(self.reader)):
+            with self.subTest(client=client):
+                self.assert_constant_queries(
+                    [
+                        (
+                            recipe.name,
+                            lambda recipe=recipe: client.get(
+                                f'/api/recipes/{recipe.id}/get-link/'
+                            ),
+                        )
+                        for recipe in (self.small_recipe, self.big_recipe)
+                    ],
+                    status.HTTP_200_OK,
+                )
+
+    def test_short_url(self):
+        self.assert_constant_queries(
+            [
+                (
+                    recipe.name,
+                    lambda recipe=recipe: self.anonymous.get(
+                        f'/api/recipes/{recipe.id}/short-url/'
+                    ),
+                )
+                for recipe in (self.small_recipe, self.big_recipe)
+            ],
+            status.HTTP_302_FOUND,
+        )
+
+    def get_recipe_data(self, size):
+        return {
+            'name': f'Новый рецепт {size}',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'image': PNG,
+            'tags': [tag.id for tag in self.tags[:size]],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 3}
+                for ingredient in self.ingredients[:size * 3]
+            ],
+        }
+
+    def test_create_recipe(self):
+        client = self.authorized(self.authors[1])
+        self.assert_constant_queries(
+            [
+                (
+                    f'size={size}',
+                    lambda size=size: client.post(
+                        '/api/recipes/',
+                        self.get_recipe_data(size),
+                        format='json',
+                    ),
+                )
+                for size in (1, 3)
+            ],
+            status.HTTP_201_CREATED,
+            warm_up=False,
+        )
+        self.assert_constant_queries(
+            [
+                (
+                    f'size={size}',
+                    lambda size=size: self.anonymous.post(
+                        '/api/recipes/',
+                        self.get_recipe_data(size),
+                        format='json',
+                    ),
+                )
+                for size in (1, 3)
+            ],
+            status.HTTP_401_UNAUTHORIZED,
+            warm_up=False,
+        )
+
+    def test_update_recipe(self):
+        client = self.authorized(self.authors[0])
+        for recipe in (self.small_recipe, self.big_recipe):
+            with self.subTest(recipe=recipe.name):
+                self.assert_constant_queries(
+                    [
+                        (
+                            f'size={size}',
+                            lambda size=size: client.patch(
+                                f'/api/recipes/{recipe.id}/',
+                                self.get_recipe_data(size),
+                                format='json',
+                            ),
+                        )
+                        for size in (1, 3, 1)
+                    ],
+                    status.HTTP_200_OK,
+                    warm_up=False,
+                )
+
+    def test_delete_recipe(self):
+        runs = [
+            (
+                recipe.name,
+                lambda recipe=recipe: client.delete(
+                    f'/api/recipes/{recipe.id}/'
+                ),
+            )
+            for recipe in (self.small_recipe, self.big_recipe)
+        ]
+        client = self.anonymous
+        self.assert_constant_queries(
+            runs, status.HTTP_401_UNAUTHORIZED, warm_up=False
+        )
+        client = self.authorized(self.authors[0])
+        self.assert_constant_queries(
+            runs, status.HTTP_204_NO_CONTENT, warm_up=False
+        )
+
+    def assert_constant_toggle(self, url, created_status, user):
+        recipes = (self.small_recipe, self.big_recipe)
+        client = self.anonymous
+        runs = [
+            (
+                recipe.name,
+                lambda recipe=recipe: client.post(url.format(recipe.id)),
+            )
+            for recipe in recipes
+        ]
+        self.assert_constant_queries(
+            runs, status.HTTP_401_UNAUTHORIZED, warm_up=False
+        )
+        client = self.authorized(user)
+        self.assert_constant_queries(runs, created_status, warm_up=False)
+        self.assert_constant_queries(
+            [
+                (
+                    recipe.name,
+                    lambda recipe=recipe: client.delete(
+                        url.format(recipe.id)
+                    ),
+                )
+                for recipe in recipes
+            ],
+            status.HTTP_204_NO_CONTENT,
+            warm_up=False,
+        )
+
+    def test_favorite(self):
+        self.assert_constant_toggle(
+            '/api/recipes/{}/favorite/', status.HTTP_201_CREATED, self.reader
+        )
+
+    def test_shopping_cart(self):
+        self.assert_constant_toggle(
+            '/api/recipes/{}/shopping_cart/',
+            status.HTTP_201_CREATED,
+            self.reader,
+        )
+
+    def test_download_shopping_cart(self):
+        url = '/api/recipes/download_shopping_cart/'
+        for file_format in ('txt', 'csv'):
+            with self.subTest(file_format=file_format):
+                self.assert_constant_queries(
+                    self.authorized_runs(
+                        (self.fan, self.reader),
+                        lambda client: client.get(
+                            f'{url}?format={file_format}'
+                        ),
+                    ),
+                    status.HTTP_200_OK,
+                )
+        self.assert_constant_queries(
+            [('anonymous', lambda: self.anonymous.get(url))] * 2,
+            status.HTTP_401_UNAUTHORIZED,
+        )
+
+
+class RecipeCacheQueryCountTests(QueryCountTestCase):
+    """Ответы из кеша: флаги пользователя накладываются одним запросом."""
+
+    def assert_cached_constant_queries(self, runs):
+        for _, make_request in runs:
+            make_request()
+        self.assert_constant_queries(
+            runs, status.HTTP_200_OK, warm_up=False
+        )
+
+    def test_cached_recipe_list(self):
+        for client in (self.anonymous, self.authorized(self.reader)):
+            for url in ('/api/recipes/', '/api/recipes/?cursor='):
+                with self.subTest(client=client, url=url):
+                    self.assert_cached_constant_queries(
+                        self.get_runs(client, url)
+                    )
+
+    def test_cached_recipe_detail(self):
+        for client in (self.anonymous, self.authorized(self.reader)):
+            with self.subTest(client=client):
+                self.assert_cached_constant_queries([
+                    (
+                        recipe.name,
+                        lambda recipe=recipe: client.get(
+                            f'/api/recipes/{recipe.id}/'
+                        ),
+                    )
+                    for recipe in (self.recipes[0], self.big_recipe)
+                ])
+
+    def test_cached_user_flags(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        self.anonymous.get(url)
+        response = self.authorized(self.reader).get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertTrue(response.data['is_favorited'])
+        self.assertTrue(response.data['is_in_shopping_cart'])
+        self.assertTrue(response.data['author']['is_subscribed'])
+
+    @override_settings(ALLOWED_HOSTS=['a.example', 'b.example'])
+    def test_cached_per_host(self):
+        for url in (
+            '/api/recipes/', f'/api/recipes/{self.recipes[0].id}/'
+        ):
+            with self.subTest(url=url):
+                self.anonymous.get(url, HTTP_HOST='a.example')
+                response = self.anonymous.get(url, HTTP_HOST='b.example')
+                self.assertEqual(response['X-Cache'], 'MISS')
+                self.assertIn(b'http://b.example/', response.content)
+                self.assertNotIn(b'a.example', response.content)
+
+
+class UserQueryCountTests(QueryCountTestCase):
+
+    def test_user_list(self):
+        for client in (self.anonymous, self.authorized(self.reader)):
+            with self.subTest(client=client):
+                self.assert_constant_queries(
+                    self.get_runs(client, '/api/users/'),
+                    status.HTTP_200_OK,
+                )
+
+    def test_user_detail(self):
+        for client in (self.anonymous, self.authorized(self.reader)):
+            with self.subTest(client=client):
+                self.assert_constant_queries(
+                    [
+                        (
+                            user.username,
+                            lambda user=user: client.get(
+                                f'/api/users/{user.id}/'
+                            ),
+                        )
+                        for user in (self.fan, self.authors[0])
+                    ],
+                    status.HTTP_200_OK,
+                )
+
+    def test_me(self):
+        self.assert_constant_queries(
+            self.authorized_runs(
+                (self.fan, self.reader),
+                lambda client: client.get('/api/users/me/'),
+            ),
+            status.HTTP_200_OK,
+        )
+        self.assert_constant_queries(
+            [('anonymous', lambda: self.anonymous.get('/api/users/me/'))] * 2,
+            status.HTTP_401_UNAUTHORIZED,
+        )
+
+    def test_subscriptions(self):
+        client = self.authorized(self.reader)
+        for recipes_limit in PAGE_SIZES:
+            with self.subTest(recipes_limit=recipes_limit):
+                self.assert_constant_queries(
+                    self.get_runs(
+                        client,
+                        f'/api/users/subscriptions/'
+                        f'?recipes_limit={recipes_limit}',
+                    ),
+                    status.HTTP_200_OK,
+                )
+        self.assert_constant_queries(
+            self.get_runs(
+                client, '/api/users/subscriptions/?limit=3',
+                param='recipes_limit',
+            ),
+            status.HTTP_200_OK,
+        )
+        self.assert_constant_queries(
+            self.get_runs(self.anonymous, '/api/users/subscriptions/'),
+            status.HTTP_401_UNAUTHORIZED,
+        )
+
+    def test_subscribe(self):
+        url = '/api/users/{}/subscribe/?recipes_limit={}'
+        runs = [
+            (
+                author.username,
+                lambda author=author, size=size: client.post(
+                    url.format(author.id, size)
+                ),
+            )
+            for author, size in zip(self.authors, PAGE_SIZES)
+        ]
+        client = self.anonymous
+        self.assert_constant_queries(
+            runs, status.HTTP_401_UNAUTHORIZED, warm_up=False
+        )
+        client = self.authorized(self.fan)
+        self.assert_constant_queries(
+            runs, status.HTTP_201_CREATED, warm_up=False
+        )
+        self.assert_constant_queries(
+            [
+                (
+                    author.username,
+                    lambda author=author: client.delete(
+                        url.format(author.id, 1)
+                    ),
+                )
+                for author in self.authors
+            ],
+            status.HTTP_204_NO_CONTENT,
+            warm_up=False,
+        )
+
+    def test_avatar(self):
+        self.assert_constant_queries(
+            self.authorized_runs(
+                (self.fan, self.reader),
+                lambda client: client.put(
+                    '/api/users/me/avatar/', {'avatar': PNG}, format='json'
+                ),
+            ),
+            status.HTTP_200_OK,
+            warm_up=False,
+        )
+        self.assert_constant_queries(
+            self.authorized_runs(
+                (self.fan, self.reader),
+                lambda client: client.delete('/api/users/me/avatar/'),
+            ),
+            status.HTTP_204_NO_CONTENT,
+            warm_up=False,
+        )
+
+    def test_token(self):
+        self.assert_constant_queries(
+            [
+                (
+                    user.username,
+                    lambda user=user: self.anonymous.post(
+                        '/api/auth/token/login/',
+                        {
+                            'email': user.email,
+                            'password': 'password-for-tests',
+                        },
+                        format='json',
+                    ),
+                )
+                for user in (self.fan, self.reader)
+            ],
+            status.HTTP_200_OK,
+            warm_up=False,
+        )
+        self.assert_constant_queries(
+            self.authorized_runs(
+                (self.fan, self.reader),
+                lambda client: client.post('/api/auth/token/logout/'),
+            ),
+            status.HTTP_204_NO_CONTENT,
+            warm_up=False,
+        )
+
+
+class CatalogQueryCountTests(QueryCountTestCase):
+
+    def test_catalog_lists(self):
+        for client in (self.anonymous, self.authorized(self.reader)):
+            for url in ('/api/tags/', '/api/ingredients/'):
+                with self.subTest(client=client, url=url):
+                    self.assert_constant_queries(
+                        [(url, lambda url=url: client.get(url))] * 2,
+                        status.HTTP_200_OK,
+                    )
+
+    def test_ingredient_search(self):
+        for client in (self.anonymous, self.authorized(self.reader)):
+            with self.subTest(client=client):
+                self.assert_constant_queries(
+                    self.get_runs(
+                        client,
+                        '/api/ingredients/',
+                        sizes=('и', 'Ингредиент', 'Ингридиент 1'),
+                        param='name',
+                    ),
+                    status.HTTP_200_OK,
+                )
+
+    def test_catalog_detail(self):
+        for client in (self.anonymous, self.authorized(self.reader)):
+            with self.subTest(client=client):
+                self.assert_constant_queries(
+                    [
+                        (
+                            url,
+                            lambda url=url: client.get(url),
+                        )
+                        for url in (
+                            f'/api/tags/{self.tags[0].id}/',
+                            f'/api/ingredients/{self.ingredients[0].id}/',
+                        )
+                    ],
+                    status.HTTP_200_OK,
+                )
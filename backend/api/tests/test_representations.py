@@ -0,0 +1,163 @@
+import datetime
+import io
+import shutil
+import tempfile
+import uuid
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
+
+from api.renderers import FastJSONRenderer
+from ingredients.models import Ingredient
+from tags.models import Tag
+from users.models import User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    IMAGE_VARIANT_WORKERS=0,
+    RECIPE_RESPONSE_CACHE=False,
+)
+class FastListSerializationTests(APITestCase):
+    """Быстрая выдача списков совпадает с сериализаторами байт в байт."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {i}', slug=f'tag{i}') for i in range(4)
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(30)
+        )
+        call_command(
+            'seed_data',
+            users=20,
+            recipes=80,
+            subscriptions_per_user=4,
+            stdout=io.StringIO(),
+        )
+        cls.users = list(dict.fromkeys((
+            User.objects.order_by('-recipes_count', 'id').first(),
+            User.objects.filter(favorites__isnull=False).last(),
+            User.objects.filter(subscriptions__isnull=False).first(),
+        )))
+        User.objects.filter(pk=cls.users[0].pk).update(
+            avatar='users/avatar.png'
+        )
+        cls.tokens = {
+            user: Token.objects.create(user=user).key for user in cls.users
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def get_urls(self):
+        author = self.users[0]
+        return (
+            '/api/recipes/',
+            '/api/recipes/?page=3&limit=7',
+            '/api/recipes/?cursor=&limit=7',
+            '/api/recipes/?tags=tag0&tags=tag1',
+            f'/api/recipes/?author={author.id}&limit=50',
+            '/api/recipes/?is_favorited=1',
+            '/api/recipes/?is_in_shopping_cart=1',
+            '/api/recipes/?page=100',
+            '/api/users/',
+            '/api/users/?page=2&limit=5',
+            '/api/users/?cursor=&limit=5',
+            '/api/users/subscriptions/',
+            '/api/users/subscriptions/?recipes_limit=1',
+            '/api/users/subscriptions/?recipes_limit=0&limit=2',
+        )
+
+    def get_cursor_urls(self, url):
+        """Адрес и адреса следующих двух страниц по курсору."""
+        urls = [url]
+        for _ in range(2):
+            response = self.client.get(urls[-1])
+            if not response.json().get('next'):
+                break
+            urls.append(response.json()['next'])
+        return urls
+
+    def request(self, url, user, fast):
+        cache.clear()
+        client = APIClient()
+        if user is not None:
+            client.credentials(
+                HTTP_AUTHORIZATION=f'Token {self.tokens[user]}'
+            )
+        with override_settings(FAST_LIST_SERIALIZATION=fast):
+            response = client.get(url)
+        # Ответ FastJSONRenderer совпадает с рендерером DRF.
+        self.assertEqual(
+            response.content, JSONRenderer().render(response.data)
+        )
+        return response.status_code, response.content
+
+    def test_same_json(self):
+        for user in (None, *self.users):
+            self.client.credentials(**(
+                {'HTTP_AUTHORIZATION': f'Token {self.tokens[user]}'}
+                if user else {}
+            ))
+            for url in self.get_urls():
+                urls = (
+                    self.get_cursor_urls(url) if 'cursor' in url else [url]
+                )
+                for page_url in urls:
+                    with self.subTest(url=page_url, user=str(user)):
+                        self.assertEqual(
+                            self.request(page_url, user, fast=True),
+                            self.request(page_url, user, fast=False),
+                        )
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """FastJSONRenderer отдаёт те же байты, что и JSONRenderer DRF."""
+
+    def test_same_bytes(self):
+        moment = datetime.datetime(2024, 2, 29, 23, 59, 58, 123456)
+        payloads = (
+            {'name': 'Борщ «Украинский» — 🍲', 'text': 'строка\u2028\u2029'},
+            {'amount': Decimal('12.50'), 'ratio': Decimal('-0.001')},
+            {
+                'naive': moment,
+                'aware': timezone.make_aware(moment, datetime.timezone.utc),
+                'offset': moment.replace(
+                    tzinfo=datetime.timezone(datetime.timedelta(hours=3))
+                ),
+                'date': moment.date(),
+                'time': moment.time(),
+                'duration': datetime.timedelta(hours=1, seconds=5),
+            },
+            {
+                'results': [
+                    {'id': 1, 'tags': [{'slug': 'завтрак'}], 'image': None},
+                    {'id': 2, 'tags': [], 'ingredients': [[1, 2.5], []]},
+                ],
+                'next': None,
+                'count': 2,
+            },
+            {'uuid': uuid.UUID(int=1), 'lazy': gettext_lazy('Рецепты')},
+            [1, 2.5, True, False, None, 'x', [[], {}]],
+            {'big': 2 ** 70},
+        )
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                self.assertEqual(
+                    FastJSONRenderer().render(payload),
+                    JSONRenderer().render(payload),
+                )
@@ -0,0 +1,79 @@
+import io
+import time
+from unittest import mock
+
+from django.db import connection
+from django.db.models import F
+
+from api.catalog import CATALOG_VERSION
+from api.indexes import ingredient_index
+from api.management.commands.explain_queries import (Command,
+                                                     sqlite_findings)
+from api.models import Version
+from api.tests.test_query_counts import QueryCountTestCase
+from api.versions import bump_version
+from foodgram.constants import INDEX_VERSION_CHECK_INTERVAL
+from ingredients.models import Ingredient
+
+
+class RecipeSearchTests(QueryCountTestCase):
+    """Поиск выполняет полнотекстовый запрос один раз на выдачу."""
+
+    def test_ranked_results(self):
+        response = self.anonymous.get('/api/recipes/?search=большой')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.big_recipe.id],
+        )
+        response = self.anonymous.get('/api/recipes/?search=рецепт&limit=50')
+        self.assertEqual(response.data['count'], len(self.recipes))
+
+    def test_no_per_row_search(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('План проверяется только для SQLite')
+        for url in (
+            '/api/recipes/?search=рецепт',
+            '/api/recipes/?search=рецепт&cursor=',
+            '/api/recipes/?search=рецепт&is_favorited=1',
+        ):
+            with self.subTest(url=url):
+                findings = Command(stdout=io.StringIO()).explain(
+                    self.authorized(self.reader), url, sqlite_findings
+                )
+                self.assertFalse(
+                    [f for f in findings if 'per_row_search' in f], findings
+                )
+
+
+class IngredientIndexTests(QueryCountTestCase):
+    """Автодополнение не читает версию каталога на каждый запрос."""
+
+    def get_names(self):
+        return [
+            ingredient['name']
+            for ingredient in ingredient_index.search('кардамон')
+        ]
+
+    def test_version_check_interval(self):
+        self.assertEqual(self.get_names(), [])
+        with self.assertNumQueries(0):
+            self.get_names()
+        # Каталог изменён другим процессом: это видно через интервал.
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='кардамон', measurement_unit='г')]
+        )
+        Version.objects.filter(name=CATALOG_VERSION).update(
+            value=F('value') + 1
+        )
+        self.assertEqual(self.get_names(), [])
+        later = time.monotonic() + INDEX_VERSION_CHECK_INTERVAL
+        with mock.patch('api.indexes.time.monotonic', return_value=later):
+            self.assertEqual(self.get_names(), ['кардамон'])
+
+    def test_local_changes(self):
+        self.assertEqual(self.get_names(), [])
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='кардамон', measurement_unit='г')]
+        )
+        bump_version(CATALOG_VERSION)
+        self.assertEqual(self.get_names(), ['кардамон'])
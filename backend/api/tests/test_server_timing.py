@@ -0,0 +1,14 @@
+from django.test import override_settings
+
+from api.tests.test_query_counts import QueryCountTestCase
+
+
+class ServerTimingTests(QueryCountTestCase):
+    """Заголовок Server-Timing отдаётся, только если он включён."""
+
+    def test_header(self):
+        for enabled in (False, True):
+            with self.subTest(enabled=enabled):
+                with override_settings(SERVER_TIMING=enabled):
+                    response = self.anonymous.get('/api/tags/')
+                self.assertEqual('Server-Timing' in response, enabled)
@@ -0,0 +1,122 @@
+import io
+import threading
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase, skipUnlessDBFeature
+
+from api.tests.test_query_counts import QueryCountTestCase
+from ingredients.models import Ingredient
+from recipes.management.commands.reconcile_shopping_lists import (
+    get_actual_items, get_expected_items)
+from recipes.models import (RecipeIngredient, ShoppingCart,
+                            ShoppingListItem)
+from users.models import User
+
+
+class ShoppingListSyncTests(QueryCountTestCase):
+    """Списки покупок следуют за любыми изменениями корзин и рецептов."""
+
+    def assert_in_sync(self):
+        self.assertEqual(get_actual_items(), get_expected_items())
+
+    def test_cart_changes(self):
+        cart = ShoppingCart.objects.create(
+            user=self.fan, recipe=self.big_recipe
+        )
+        self.assert_in_sync()
+        cart.recipe = self.recipes[5]
+        cart.save()
+        self.assert_in_sync()
+        cart.delete()
+        self.assert_in_sync()
+
+    def test_recipe_ingredient_changes(self):
+        recipe_ingredient = RecipeIngredient.objects.create(
+            recipe=self.small_recipe,
+            ingredient=self.ingredients[7],
+            amount=3,
+        )
+        self.assert_in_sync()
+        recipe_ingredient.amount = 8
+        recipe_ingredient.ingredient = self.ingredients[8]
+        recipe_ingredient.save()
+        self.assert_in_sync()
+        recipe_ingredient.recipe = self.big_recipe
+        recipe_ingredient.save()
+        self.assert_in_sync()
+        recipe_ingredient.delete()
+        self.assert_in_sync()
+
+    def test_cascades(self):
+        self.small_recipe.delete()
+        self.assert_in_sync()
+        self.authors[1].delete()
+        self.assert_in_sync()
+        self.ingredients[2].delete()
+        self.assert_in_sync()
+        self.cook.delete()
+        self.assert_in_sync()
+
+    def test_paused(self):
+        with ShoppingListItem.objects.paused():
+            ShoppingCart.objects.create(user=self.fan, recipe=self.big_recipe)
+        self.assertNotEqual(get_actual_items(), get_expected_items())
+
+    def test_default_ordering_without_joins(self):
+        sql = str(ShoppingListItem.objects.filter(user=self.reader).query)
+        self.assertNotIn(Ingredient._meta.db_table, sql)
+        self.assertNotIn(User._meta.db_table, sql)
+
+    def test_reconcile(self):
+        ShoppingListItem.objects.filter(user=self.reader).delete()
+        ShoppingListItem.objects.filter(user=self.fan).update(total_amount=1)
+        call_command(
+            'reconcile_shopping_lists', dry_run=True, stdout=io.StringIO()
+        )
+        self.assertNotEqual(get_actual_items(), get_expected_items())
+        stdout = io.StringIO()
+        call_command('reconcile_shopping_lists', stdout=stdout)
+        self.assertIn('пересчитаны: 2', stdout.getvalue())
+        self.assert_in_sync()
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ShoppingListConcurrencyTests(TransactionTestCase):
+    """Параллельные добавления в одну корзину не нарушают уникальность."""
+
+    THREADS = 8
+
+    def test_parallel_deltas(self):
+        user = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='password'
+        )
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def add():
+            try:
+                barrier.wait()
+                ShoppingListItem.objects.apply_delta(
+                    [user.id], {ingredient.id: 1}
+                )
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=add) for _ in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=user).total_amount,
+            self.THREADS,
+        )
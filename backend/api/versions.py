@@ -0,0 +1,79 @@
+"""Версии наборов данных для кешей.
+
+Версию должны видеть все процессы: серверы gunicorn и uvicorn и команды
+manage.py. Поэтому она хранится в общем кеше Django, если он общий
+(Redis, Memcached, база, файлы), а при кеше в памяти процесса — в
+таблице api.Version.
+"""
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from api.models import Version
+
+VERSION_KEY = 'version:{}'
+
+# Сколько раз версии менялись в этом процессе: данные в памяти процесса
+# видят свои изменения сразу, не дожидаясь проверки общей версии.
+_local_bumps = 0
+
+
+def _initial_version():
+    # Новый счётчик начинается с текущего времени, чтобы после сброса кеша
+    # или базы версия не совпала с одной из уже выданных.
+    return time.time_ns()
+
+
+def is_cache_shared():
+    """Виден ли кеш по умолчанию другим процессам."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def get_version(name):
+    """Вернуть текущую версию набора данных name."""
+    if not is_cache_shared():
+        version = Version.objects.filter(name=name).values_list(
+            'value', flat=True
+        ).first()
+        if version is None:
+            version = Version.objects.get_or_create(
+                name=name, defaults={'value': _initial_version()}
+            )[0].value
+        return version
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Сменить версию набора данных name после записи в него."""
+    global _local_bumps
+    if not is_cache_shared():
+        versions = Version.objects.filter(name=name)
+        if not versions.update(value=F('value') + 1):
+            try:
+                with transaction.atomic():
+                    Version.objects.create(
+                        name=name, value=_initial_version()
+                    )
+            except IntegrityError:
+                versions.update(value=F('value') + 1)
+    else:
+        key = VERSION_KEY.format(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), timeout=None)
+    _local_bumps += 1
+
+
+def get_local_bumps():
+    """Сколько раз версии менялись в этом процессе."""
+    return _local_bumps
@@ -1,26 +1,42 @@
+from functools import partial
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F, Prefetch, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.views.decorators.http import require_GET
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 
-from api.filters import IngredientFilter, RecipeFilter
+from api.catalog import catalog_response
+from api.filters import PANTRY_ORDERING, RecipeFilter
+from api.indexes import ingredient_index
+from api.negotiation import FormatContentNegotiation
 from api.pagination import CustomLimitPagination
+from api.parsers import MultiPartJSONParser
 from api.permissions import IsAdminOrAuthorOrReadOnly
+from api.recipe_cache import detail_response, list_response
+from api.representations import (USER_FIELDS, get_recipe_values,
+                                 get_recipes, get_subscriptions, get_users)
+from api.renderers import SHOPPING_LIST_RENDERERS
 from api.serializers import (AvatarSerializer, CustomUserSerializer,
                              FavoriteSerializer, FollowCreateSerializer,
                              FollowReadSerializer, IngredientSerializer,
                              RecipeCreateSerializer, RecipeReadSerializer,
                              ShoppingCartSerializer, TagSerializer)
+from foodgram.constants import PAGE_SIZE, SHOPPING_LIST_CHUNK_SIZE
 from ingredients.models import Ingredient
-from recipes.models import Favorite, Recipe, RecipeIngredient, ShoppingCart
+from recipes.models import (Favorite, Recipe, ShoppingCart, ShoppingListItem,
+                            prefetch_recipe_ingredients)
 from tags.models import Tag
 from users.models import Subscription
 
@@ -29,11 +45,12 @@ User = get_user_model()
 
 @require_GET
 def short_url(request, pk):
-    url = reverse('recipes', args=[pk])
+    url = reverse('api:recipes-detail', args=[pk])
     return redirect(url)
 
 
 class CustomUserViewSet(UserViewSet):
+    keyset_ordering = ('username', 'id')
     pagination_class = CustomLimitPagination
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
@@ -45,6 +62,14 @@ class CustomUserViewSet(UserViewSet):
             ]
         return super().get_permissions()
 
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_LIST_SERIALIZATION:
+            return super().list(request, *args, **kwargs)
+        rows = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset()).values(*USER_FIELDS)
+        )
+        return self.get_paginated_response(get_users(rows, request))
+
     @action(
         methods=['PUT', 'DELETE'],
         detail=False,
@@ -62,8 +87,7 @@ class CustomUserViewSet(UserViewSet):
             return Response(serializer.data)
 
         elif self.request.method == 'DELETE':
-            user = self.request.user
-            user.avatar.delete()
+            self.request.user.avatar.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -87,11 +111,9 @@ class CustomUserViewSet(UserViewSet):
             serializer.is_valid(raise_exception=True)
             serializer.save()
 
-            author_annotated = User.objects.annotate(
-                recipes_count=Count('recipes')
-            ).filter(id=id).first()
+            self.attach_limited_recipes([subscribed_user])
             serializer = FollowReadSerializer(
-                author_annotated,
+                subscribed_user,
                 context={'request': request}
             )
 
@@ -119,34 +141,109 @@ class CustomUserViewSet(UserViewSet):
     )
     def get_subscriptions(self, request):
         user = request.user
-        queryset = User.objects.filter(subscribers__user=user).annotate(
-            recipes_count=Count('recipes')
-        )
+        queryset = User.objects.filter(subscribers__user=user)
+        if settings.FAST_LIST_SERIALIZATION:
+            rows = self.paginate_queryset(
+                queryset.values(*USER_FIELDS, 'recipes_count')
+            )
+            return self.get_paginated_response(get_subscriptions(
+                rows, request, self.get_limited_recipes()
+            ))
         pages = self.paginate_queryset(queryset)
+        self.attach_limited_recipes(pages)
         serializer = FollowReadSerializer(
             pages, many=True, context={'request': request}
         )
         return self.get_paginated_response(serializer.data)
 
+    def get_recipes_limit(self):
+        try:
+            return max(
+                int(self.request.query_params.get('recipes_limit', PAGE_SIZE)),
+                0
+            )
+        except ValueError:
+            return PAGE_SIZE
+
+    def get_limited_recipes(self):
+        """Первые recipes_limit рецептов каждого автора."""
+        return Recipe.objects.annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=F('name').asc(),
+            )
+        ).filter(row_number__lte=self.get_recipes_limit())
+
+    def attach_limited_recipes(self, authors):
+        """Подгрузить первые recipes_limit рецептов авторов одним запросом."""
+        prefetch_related_objects(
+            authors,
+            Prefetch(
+                'recipes',
+                queryset=self.get_limited_recipes(),
+                to_attr='limited_recipes',
+            ),
+        )
+
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
     pagination_class = None
     permission_classes = [AllowAny]
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return catalog_response(
+            request, 'ingredients', self.get_queryset(), IngredientSerializer
+        )
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
     pagination_class = CustomLimitPagination
+    parser_classes = (JSONParser, MultiPartJSONParser)
     permission_classes = [IsAdminOrAuthorOrReadOnly]
     queryset = Recipe.objects.select_related('author').prefetch_related(
-        'ingredients', 'tags'
+        prefetch_recipe_ingredients(),
+        'tags',
     )
 
+    @property
+    def keyset_ordering(self):
+        if self.request.query_params.get('search', '').strip():
+            return ('-search_rank', 'id')
+        if self.request.query_params.get('pantry'):
+            return PANTRY_ORDERING
+        return ('name', 'id')
+
+    def get_queryset(self):
+        return super().get_queryset().with_user_flags(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        return list_response(
+            request, partial(self.list_recipes, request, *args, **kwargs)
+        )
+
+    def list_recipes(self, request, *args, **kwargs):
+        if not settings.FAST_LIST_SERIALIZATION:
+            return super().list(request, *args, **kwargs)
+        rows = self.paginate_queryset(
+            get_recipe_values(self.filter_queryset(self.get_queryset()))
+        )
+        return self.get_paginated_response(get_recipes(rows, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        return detail_response(
+            request,
+            kwargs['pk'],
+            partial(super().retrieve, request, *args, **kwargs),
+        )
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve', 'get-link'):
             return RecipeReadSerializer
@@ -158,21 +255,31 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated],
         url_path='download_shopping_cart',
         url_name='download_shopping_cart',
+        renderer_classes=SHOPPING_LIST_RENDERERS,
+        content_negotiation_class=FormatContentNegotiation,
     )
     def download_shopping_cart(self, request):
         ingredients = (
-            RecipeIngredient.objects.filter(
-                recipe__in=Recipe.objects.filter(
-                    in_shopping_cart__user=request.user
-                )
+            ShoppingListItem.objects.filter(user=request.user)
+            .values(
+                'ingredient__name',
+                'ingredient__measurement_unit',
+                sum=F('total_amount'),
             )
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(sum=Sum('amount'))
+            .order_by('ingredient__name')
+            .iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+        )
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients), content_type=content_type
         )
-        shopping_list = self.add_shopping_list_to_txt(ingredients)
-        return HttpResponse(
-            shopping_list, content_type='text/plain', status=200
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{renderer.format}"'
         )
+        return response
 
     @action(
         detail=True,
@@ -217,7 +324,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 data={'recipe': recipe.id, 'user': user.id}
             )
             serializer.is_valid(raise_exception=True)
-            serializer.save(recipe=recipe, user=user)
+            with transaction.atomic():
+                # Список покупок дополняет сигнал в той же транзакции.
+                serializer.save(recipe=recipe, user=user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         deleted_objects_number, _ = Favorite.objects.filter(
@@ -258,7 +367,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 data={'recipe': recipe.id, 'user': user.id}
             )
             serializer.is_valid(raise_exception=True)
-            serializer.save(recipe=recipe, user=user)
+            with transaction.atomic():
+                # Список покупок дополняет сигнал в той же транзакции.
+                serializer.save(recipe=recipe, user=user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         deleted_count, _ = ShoppingCart.objects.filter(
@@ -273,17 +384,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
             status=status.HTTP_404_NOT_FOUND,
         )
 
-    @staticmethod
-    def add_shopping_list_to_txt(ingredients):
-        return '\n'.join(
-            f'{ingredient["ingredient__name"]} - {ingredient["sum"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            for ingredient in ingredients
-        )
-
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
     permission_classes = [IsAdminOrAuthorOrReadOnly]
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+
+    def list(self, request, *args, **kwargs):
+        return catalog_response(
+            request, 'tags', self.get_queryset(), TagSerializer
+        )
@@ -0,0 +1,16 @@
+from django.urls import path
+
+from api import async_views
+from foodgram.urls import urlpatterns as sync_urlpatterns
+
+# Частые GET-запросы обслуживаются асинхронными представлениями, всё
+# остальное — обычными маршрутами из foodgram.urls.
+urlpatterns = [
+    path('api/recipes/', async_views.recipe_list),
+    path('api/recipes/<int:pk>/', async_views.recipe_detail),
+    path('api/ingredients/', async_views.ingredient_list),
+    path('api/ingredients/<int:pk>/', async_views.ingredient_detail),
+    path('api/tags/', async_views.tag_list),
+    path('api/tags/<int:pk>/', async_views.tag_detail),
+    path('api/users/subscriptions/', async_views.subscriptions),
+] + sync_urlpatterns
@@ -2,12 +2,18 @@ MAX_COLOR_LENGHT = 7
 MAX_EMAIL_LENGTH = 254
 MAX_FIELD_LENGTH = 256
 MAX_FIRST_NAME_LENGTH = 150
+MAX_IMAGE_DIMENSION = 8000
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
 MAX_INGREDIENT_NAME_LENGTH = 128
 MAX_LAST_NAME_LENGTH = 150
 MAX_MEASUREMENT_LENGTH = 64
 MAX_PASSWORD_LENGTH = 150
+# Картинка в base64 на треть больше файла; остальным полям — 1 МБ.
+# client_max_body_size в infra/nginx.conf должен быть не меньше.
+MAX_REQUEST_BODY_SIZE = MAX_IMAGE_SIZE * 4 // 3 + 1024 * 1024
 MAX_TAG_LENGTH = 32
 MAX_USERNAME_LENGTH = 150
+MAX_VERSION_NAME_LENGTH = 64
 
 AMOUNT_MAX = 10000
 AMOUNT_MIN = 1
@@ -17,3 +23,16 @@ MIN_COOKING_TIME = 1
 REGULAR_CHECK_LOGIN_VALID = r'^[\w. @ +-]+\Z'
 
 PAGE_SIZE = 6
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TIMEOUT = 5 * 60
+SHOPPING_LIST_CHUNK_SIZE = 500
+
+PANTRY_MIN_COVERAGE = 0.5
+RECIPE_SEARCH_CONFIG = 'russian'
+RECIPE_CACHE_TIMEOUT = 60 * 60
+CATALOG_CACHE_TIMEOUT = 24 * 60 * 60
+
+INGREDIENT_SEARCH_CACHE_SIZE = 1024
+INGREDIENT_SEARCH_LIMIT = 20
+INGREDIENT_SEARCH_MIN_TYPO_LENGTH = 3
+INDEX_VERSION_CHECK_INTERVAL = 5
@@ -1,42 +1,214 @@
+import csv
 import json
+import time
 from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.catalog import CATALOG_VERSION
+from api.versions import bump_version
 from ingredients.models import Ingredient
 from tags.models import Tag
 
+BATCH_SIZE = 1000
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(data_file, chunk_size=JSON_CHUNK_SIZE):
+    """Элементы JSON-массива по одному, без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer, position = '', 0
+
+    def next_char():
+        """Первый непробельный символ, '' в конце файла."""
+        nonlocal buffer, position
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            buffer, position = data_file.read(chunk_size), 0
+            if not buffer:
+                return ''
+
+    def decode():
+        nonlocal buffer, position
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                chunk = data_file.read(chunk_size)
+                if not chunk:
+                    raise
+            else:
+                # Значение, дочитанное до конца блока, могло оборваться
+                # на его границе (например, число).
+                chunk = '' if end < len(buffer) else data_file.read(
+                    chunk_size
+                )
+                if not chunk:
+                    position = end
+                    return item
+            buffer, position = buffer[position:] + chunk, 0
+
+    def fail(message):
+        raise json.JSONDecodeError(message, buffer, position)
+
+    if next_char() != '[':
+        fail('Ожидался JSON-массив')
+    position += 1
+    if next_char() == ']':
+        position += 1
+    else:
+        while True:
+            next_char()
+            yield decode()
+            char = next_char()
+            position += 1
+            if char == ']':
+                break
+            if char != ',':
+                fail("Ожидалась ',' или ']'")
+    if next_char():
+        fail('Лишние данные после массива')
+
+
+def read_rows(path, fields):
+    """Построчно прочитать записи из JSON- или CSV-файла."""
+    if path.suffix == '.csv':
+        with path.open(encoding='utf-8', newline='') as data_file:
+            for row in csv.reader(data_file):
+                if row:
+                    yield dict(zip(fields, (value.strip() for value in row)))
+        return
+    with path.open(encoding='utf-8') as data_file:
+        yield from iter_json_array(data_file)
+
 
 class Command(BaseCommand):
     help = 'Загрузить данные в модель ингредиентов и тегов'
 
-    def handle(self, *args, **options):
-        self.stdout.write(self.style.WARNING('Старт команды'))
-        base_dir = Path(__file__).resolve().parents[3]
-        data_dir = base_dir / 'data'
-        ingredients_file = data_dir / 'ingredients.json'
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--data-dir',
+            type=Path,
+            help='Каталог с ingredients.json/ingredients.csv и tags.json',
+        )
+        parser.add_argument(
+            '--ingredients',
+            type=Path,
+            help='Файл ингредиентов (JSON или CSV: название, единица)',
+        )
+        parser.add_argument('--tags', type=Path, help='Файл тегов (JSON)')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Размер пакета для bulk-запросов',
+        )
 
-        if not ingredients_file.exists():
-            self.stdout.write(
-                self.style.ERROR(f'Файл {ingredients_file} не найден')
-            )
-            return
+    def find_data_dir(self):
+        for data_dir in (settings.BASE_DIR / 'data',
+                         settings.BASE_DIR.parent / 'data'):
+            if data_dir.is_dir():
+                return data_dir
+        raise CommandError('Каталог data не найден, укажите --data-dir')
 
-        with ingredients_file.open(encoding='utf-8') as data_file_ingredients:
-            ingredient_data = json.load(data_file_ingredients)
-            for ingredient in ingredient_data:
-                Ingredient.objects.get_or_create(**ingredient)
+    def find_file(self, path, data_dir, names):
+        if path is not None:
+            if not path.exists():
+                raise CommandError(f'Файл {path} не найден')
+            return path
+        for name in names:
+            candidate = data_dir / name
+            if candidate.exists() and candidate.stat().st_size:
+                return candidate
+        raise CommandError(
+            f'В {data_dir} нет ни одного из файлов: {", ".join(names)}'
+        )
 
-        self.stdout.write(self.style.SUCCESS('Ингредиенты загружены'))
-        tags_file = data_dir / 'tags.json'
+    def sync(self, model, rows, key, fields, batch_size):
+        """Записать в модель только новые и изменившиеся строки."""
+        incoming = {}
+        for row in rows:
+            incoming[row[key]] = {field: row[field] for field in fields}
+        existing = {
+            getattr(instance, key): instance
+            for instance in model.objects.only(key, *fields)
+        }
+        to_create, to_update = [], []
+        for value, data in incoming.items():
+            instance = existing.get(value)
+            if instance is None:
+                to_create.append(model(**{key: value}, **data))
+            elif any(
+                getattr(instance, field) != data[field] for field in fields
+            ):
+                for field, field_value in data.items():
+                    setattr(instance, field, field_value)
+                to_update.append(instance)
+        model.objects.bulk_create(
+            to_create, batch_size=batch_size, ignore_conflicts=True
+        )
+        model.objects.bulk_update(
+            to_update, fields, batch_size=batch_size
+        )
+        return (
+            len(to_create),
+            len(to_update),
+            len(incoming) - len(to_create) - len(to_update),
+        )
 
-        if not tags_file.exists():
-            self.stdout.write(self.style.ERROR(f'Файл {tags_file} не найден'))
-            return
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Старт команды'))
+        started = time.perf_counter()
+        data_dir = options['data_dir'] or self.find_data_dir()
+        ingredients_file = self.find_file(
+            options['ingredients'],
+            data_dir,
+            ('ingredients.json', 'ingredients.csv'),
+        )
+        tags_file = self.find_file(options['tags'], data_dir, ('tags.json',))
 
-        with tags_file.open(encoding='utf-8') as data_file_tags:
-            tags_data = json.load(data_file_tags)
-            for tag in tags_data:
-                Tag.objects.get_or_create(**tag)
+        changed = False
+        with transaction.atomic():
+            ingredients = self.sync(
+                Ingredient,
+                read_rows(ingredients_file, ('name', 'measurement_unit')),
+                'name',
+                ('measurement_unit',),
+                options['batch_size'],
+            )
+            tags = self.sync(
+                Tag,
+                read_rows(tags_file, ('name', 'slug')),
+                'slug',
+                ('name',),
+                options['batch_size'],
+            )
+            changed = any(ingredients[:2]) or any(tags[:2])
+            if changed:
+                # bulk-запросы не вызывают сигналы моделей. Версия общая
+                # для всех процессов, поэтому запущенные серверы сбросят
+                # справочники и индекс автодополнения.
+                transaction.on_commit(
+                    lambda: bump_version(CATALOG_VERSION)
+                )
 
-        self.stdout.write(self.style.SUCCESS('Теги загружены'))
+        for label, path, (created, updated, unchanged) in (
+            ('Ингредиенты', ingredients_file, ingredients),
+            ('Теги', tags_file, tags),
+        ):
+            self.stdout.write(self.style.SUCCESS(
+                f'{label} ({path.name}): добавлено {created}, '
+                f'обновлено {updated}, без изменений {unchanged}'
+            ))
+        if changed:
+            self.stdout.write(self.style.SUCCESS(
+                'Версия каталога обновлена, кеши справочников сброшены'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.2f} с'
+        ))
@@ -1,17 +1,19 @@
 from django.contrib import admin
 
-from .models import Favorite, Recipe, RecipeIngredient, ShoppingCart
+from .models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                     ShoppingListItem)
 
 
 class RecipeIngredientInline(admin.TabularInline):
     model = Recipe.ingredients.through
+    ordering = ('ingredient__name',)
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     """Рецепты."""
 
-    list_display = ('name', 'author')
+    list_display = ('name', 'author', 'favorites_count')
     list_display_links = ('name', 'author')
     search_fields = ('name', 'author__username')
     list_filter = ('tags',)
@@ -44,6 +46,16 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     list_display_links = ('user', 'recipe')
 
 
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    """Сводные списки покупок."""
+
+    list_display = ('user', 'ingredient', 'total_amount')
+    list_display_links = ('user', 'ingredient')
+    readonly_fields = ('user', 'ingredient', 'total_amount')
+    ordering = ('user__username', 'ingredient__name')
+
+
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     """Избранные рецепты."""
@@ -1,7 +1,29 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_migrate
+
+SEARCH_INDEX_MIGRATION = ('recipes', '0007_recipe_search_index')
+
+
+def ensure_search_index(using, **kwargs):
+    """Восстановить поисковый индекс после миграций.
+
+    SQLite пересоздаёт таблицу при изменении столбцов и теряет триггеры.
+    """
+    from recipes.search import install_search_index
+
+    connection = connections[using]
+    recorder = MigrationRecorder(connection)
+    if SEARCH_INDEX_MIGRATION in recorder.applied_migrations():
+        install_search_index(connection)
 
 
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
     verbose_name = 'Рецепты'
+
+    def ready(self):
+        from recipes import signals  # noqa: F401
+        post_migrate.connect(ensure_search_index, sender=self)
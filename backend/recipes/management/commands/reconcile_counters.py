@@ -0,0 +1,66 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+User = get_user_model()
+
+COUNTERS = (
+    (User, 'recipes_count', Recipe, 'author'),
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+)
+
+
+def count_related(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = 'Сверить счётчики рецептов, избранного и корзин с данными'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, не исправляя их',
+        )
+
+    def handle(self, *args, **options):
+        for model, counter, related_model, field in COUNTERS:
+            actual = count_related(related_model, field)
+            with transaction.atomic():
+                drifted = list(
+                    model.objects.annotate(actual=actual)
+                    .exclude(**{counter: F('actual')})
+                    .values_list('pk', flat=True)
+                )
+                if drifted and not options['dry_run']:
+                    model.objects.filter(pk__in=drifted).update(
+                        **{counter: actual}
+                    )
+            label = f'{model._meta.label}.{counter}'
+            if not drifted:
+                self.stdout.write(
+                    self.style.SUCCESS(f'{label}: расхождений нет')
+                )
+            elif options['dry_run']:
+                self.stdout.write(self.style.WARNING(
+                    f'{label}: расхождений {len(drifted)}'
+                ))
+            else:
+                self.stdout.write(self.style.WARNING(
+                    f'{label}: исправлено {len(drifted)}'
+                ))
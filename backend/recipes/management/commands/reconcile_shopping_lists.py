@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from recipes.models import ShoppingCart, ShoppingListItem
+
+BATCH_SIZE = 1000
+
+
+def get_expected_items():
+    """Позиции списков покупок, посчитанные заново по корзинам."""
+    return set(
+        ShoppingCart.objects.values_list(
+            'user_id', 'recipe__recipe_ingredients__ingredient_id'
+        )
+        .annotate(total=Sum('recipe__recipe_ingredients__amount'))
+        .filter(total__gt=0)
+        .order_by()
+        .iterator()
+    )
+
+
+def get_actual_items():
+    return set(
+        ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'total_amount'
+        )
+        .order_by()
+        .iterator()
+    )
+
+
+class Command(BaseCommand):
+    help = 'Сверить сводные списки покупок с корзинами и пересчитать их'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, не исправляя их',
+        )
+
+    def handle(self, *args, **options):
+        drifted = sorted({
+            user_id
+            for user_id, *_ in get_expected_items() ^ get_actual_items()
+        })
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+            return
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f'Пользователей с расхождениями: {len(drifted)}'
+            ))
+            return
+        for start in range(0, len(drifted), BATCH_SIZE):
+            ShoppingListItem.objects.rebuild(
+                drifted[start:start + BATCH_SIZE]
+            )
+        self.stdout.write(self.style.WARNING(
+            f'Списки покупок пересчитаны: {len(drifted)}'
+        ))
@@ -0,0 +1,340 @@
+import io
+import itertools
+import math
+import random
+import time
+from array import array
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from api.indexes import bump_recipe_ingredients_version
+from api.recipe_cache import bump_recipe_versions
+from foodgram.constants import MAX_COOKING_TIME, MIN_COOKING_TIME
+from ingredients.models import Ingredient
+from recipes.models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                            ShoppingListItem)
+from tags.models import Tag
+from users.models import Subscription
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+# Показатель степенного закона популярности рецептов, авторов
+# и ингредиентов и параметр распределения Парето для активности
+# пользователей (среднее Парето с alpha = 2 равно удвоенному масштабу).
+ZIPF_EXPONENT = 1.1
+PARETO_ALPHA = 2.0
+IMAGE_NAME = 'recipes/seed.jpg'
+
+DISHES = (
+    'Суп', 'Салат', 'Пирог', 'Рагу', 'Каша', 'Запеканка', 'Омлет', 'Паста',
+    'Плов', 'Котлеты', 'Блины', 'Оладьи', 'Соус', 'Смузи', 'Кекс', 'Рулет',
+)
+STYLES = (
+    'домашний', 'быстрый', 'праздничный', 'летний', 'зимний', 'острый',
+    'бабушкин', 'лёгкий', 'сытный', 'постный',
+)
+STEPS = (
+    'Подготовьте {0} и {1}.',
+    'Нарежьте {0} небольшими кусочками.',
+    'Смешайте {0} с {1} до однородности.',
+    'Обжарьте {0} на среднем огне пять минут.',
+    'Добавьте {0} и перемешайте.',
+    'Томите на медленном огне, периодически помешивая.',
+    'Посолите и поперчите по вкусу.',
+    'Выложите на блюдо и украсьте: {0}.',
+    'Дайте настояться десять минут перед подачей.',
+)
+
+
+def zipf_cum_weights(size, exponent=ZIPF_EXPONENT):
+    """Накопленные веса закона Ципфа для рангов 1..size."""
+    return list(itertools.accumulate(
+        rank ** -exponent for rank in range(1, size + 1)
+    ))
+
+
+class Picker:
+    """Выбор элементов с вероятностью по закону Ципфа.
+
+    Ранги популярности раздаются элементам в случайном порядке, поэтому
+    популярными оказываются не обязательно первые элементы.
+    """
+
+    def __init__(self, rng, population):
+        self.population = list(population)
+        rng.shuffle(self.population)
+        self.cum_weights = zipf_cum_weights(len(self.population))
+
+    def choices(self, rng, k):
+        return rng.choices(
+            self.population, cum_weights=self.cum_weights, k=k
+        )
+
+    def sample(self, rng, k, exclude=None):
+        """Выбрать k разных элементов, кроме exclude."""
+        k = min(k, len(self.population) - (exclude is not None))
+        picked = set()
+        while len(picked) < k:
+            picked.update(self.choices(rng, k - len(picked)))
+            picked.discard(exclude)
+        return picked
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполнить базу синтетическими пользователями, рецептами, '
+        'избранным, корзинами и подписками для нагрузочного тестирования'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000, help='Число пользователей'
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=5000, help='Число рецептов'
+        )
+        parser.add_argument(
+            '--favorites-per-user',
+            type=float,
+            default=10,
+            help='Среднее число избранных рецептов у пользователя',
+        )
+        parser.add_argument(
+            '--cart-per-user',
+            type=float,
+            default=2,
+            help='Среднее число рецептов в корзине пользователя',
+        )
+        parser.add_argument(
+            '--subscriptions-per-user',
+            type=float,
+            default=5,
+            help='Среднее число подписок пользователя',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=42, help='Зерно генератора'
+        )
+        parser.add_argument(
+            '--prefix',
+            default='seed',
+            help='Префикс имён и почты создаваемых пользователей',
+        )
+        parser.add_argument(
+            '--password',
+            default='seed-password',
+            help='Пароль всех создаваемых пользователей',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Размер пакета для bulk_create',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        self.seed = options['seed']
+        self.batch_size = options['batch_size']
+        n_users, n_recipes = options['users'], options['recipes']
+        if n_users < 2 or n_recipes < 1:
+            raise CommandError('Нужно минимум 2 пользователя и 1 рецепт')
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом «{prefix}» уже есть, '
+                f'укажите другой --prefix'
+            )
+        ingredients = list(
+            Ingredient.objects.order_by('id').values_list('id', 'name')
+        )
+        tag_ids = list(Tag.objects.order_by('id').values_list('id', flat=True))
+        if not ingredients or not tag_ids:
+            raise CommandError(
+                'Нет ингредиентов или тегов, сначала выполните load_data'
+            )
+
+        authors = self.rng('authors')
+        author_picker = Picker(authors, range(n_users))
+        recipe_authors = author_picker.choices(authors, n_recipes)
+        recipe_picker = Picker(self.rng('popularity'), range(n_recipes))
+        activities = (
+            ('favorites', options['favorites_per_user'], recipe_picker),
+            ('cart', options['cart_per_user'], recipe_picker),
+            ('subscriptions', options['subscriptions_per_user'],
+             author_picker),
+        )
+
+        # Первый проход только считает счётчики, второй записывает пары
+        # тем же генератором, поэтому все пары не хранятся в памяти.
+        recipes_count = array('I', bytes(4 * n_users))
+        for author in recipe_authors:
+            recipes_count[author] += 1
+        counts = {}
+        for name, average, picker in activities[:2]:
+            counts[name] = array('I', bytes(4 * n_recipes))
+            for _, recipe in self.pairs(name, n_users, average, picker):
+                counts[name][recipe] += 1
+
+        with transaction.atomic():
+            user_ids = self.create_users(
+                n_users, prefix, options['password'], recipes_count
+            )
+            recipe_ids = self.create_recipes(
+                user_ids, recipe_authors, counts, ingredients, tag_ids
+            )
+            created = {
+                User: len(user_ids),
+                Recipe: len(recipe_ids),
+            }
+            for (name, average, picker), model, field, targets in zip(
+                activities,
+                (Favorite, ShoppingCart, Subscription),
+                ('recipe_id', 'recipe_id', 'subscribed_user_id'),
+                (recipe_ids, recipe_ids, user_ids),
+            ):
+                created[model] = self.bulk_create(model, (
+                    model(user_id=user_ids[user], **{field: targets[target]})
+                    for user, target in self.pairs(
+                        name, n_users, average, picker
+                    )
+                ))
+            ShoppingListItem.objects.rebuild()
+            bump_recipe_ingredients_version()
+            bump_recipe_versions(())
+
+        for model, count in created.items():
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.2f} с'
+        ))
+
+    def rng(self, name):
+        return random.Random(f'{self.seed}:{name}')
+
+    def pairs(self, name, n_users, average, picker):
+        """Пары (пользователь, цель) с активностью по закону Парето.
+
+        При одинаковых аргументах последовательность всегда одна и та же.
+        """
+        rng = self.rng(name)
+        scale = average * (PARETO_ALPHA - 1) / PARETO_ALPHA
+        for user in range(n_users):
+            count = math.floor(scale * rng.paretovariate(PARETO_ALPHA))
+            exclude = user if name == 'subscriptions' else None
+            for target in sorted(picker.sample(rng, count, exclude)):
+                yield user, target
+
+    def bulk_create(self, model, objects):
+        total = 0
+        objects = iter(objects)
+        while batch := list(itertools.islice(objects, self.batch_size)):
+            model.objects.bulk_create(batch, batch_size=self.batch_size)
+            total += len(batch)
+        return total
+
+    def create_users(self, n_users, prefix, password, recipes_count):
+        # Хеш пароля считается долго, поэтому он один на всех.
+        password = make_password(password)
+        users = [
+            User(
+                username=f'{prefix}{number}',
+                email=f'{prefix}{number}@example.com',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password=password,
+                recipes_count=recipes_count[number],
+            )
+            for number in range(n_users)
+        ]
+        User.objects.bulk_create(users, batch_size=self.batch_size)
+        if users[0].pk is None:
+            raise CommandError('База не возвращает id из bulk_create')
+        return array('Q', (user.pk for user in users))
+
+    def create_recipes(self, user_ids, recipe_authors, counts, ingredients,
+                       tag_ids):
+        rng = self.rng('recipes')
+        ingredient_picker = Picker(rng, range(len(ingredients)))
+        tag_picker = Picker(rng, range(len(tag_ids)))
+        image = self.get_image()
+        recipe_ids = array('Q')
+        for start in range(0, len(recipe_authors), self.batch_size):
+            recipes, compositions = [], []
+            for number in range(
+                start, min(start + self.batch_size, len(recipe_authors))
+            ):
+                composition = sorted(ingredient_picker.sample(
+                    rng, round(rng.triangular(2, 14, 6))
+                ))
+                names = [ingredients[index][1] for index in composition]
+                rng.shuffle(names)
+                recipes.append(Recipe(
+                    author_id=user_ids[recipe_authors[number]],
+                    name=(
+                        f'{rng.choice(DISHES)} {rng.choice(STYLES)}: '
+                        f'{names[0]}'
+                    ),
+                    text=' '.join(
+                        rng.choice(STEPS).format(*rng.sample(names, 2))
+                        for _ in range(rng.randint(2, 6))
+                    ),
+                    cooking_time=max(MIN_COOKING_TIME, min(
+                        MAX_COOKING_TIME,
+                        round(rng.lognormvariate(3.4, 0.6)),
+                    )),
+                    image=image,
+                    favorites_count=counts['favorites'][number],
+                    in_carts_count=counts['cart'][number],
+                ))
+                compositions.append((
+                    composition,
+                    tag_picker.sample(rng, rng.choice((1, 1, 2, 3))),
+                ))
+            Recipe.objects.bulk_create(recipes)
+            RecipeIngredient.objects.bulk_create(
+                (
+                    RecipeIngredient(
+                        recipe_id=recipe.pk,
+                        ingredient_id=ingredients[index][0],
+                        amount=rng.choice((1, 2, 5, 10, 50, 100, 200, 500)),
+                    )
+                    for recipe, (composition, _) in zip(
+                        recipes, compositions
+                    )
+                    for index in composition
+                ),
+                batch_size=self.batch_size,
+            )
+            Recipe.tags.through.objects.bulk_create(
+                (
+                    Recipe.tags.through(
+                        recipe_id=recipe.pk, tag_id=tag_ids[index]
+                    )
+                    for recipe, (_, tags) in zip(recipes, compositions)
+                    for index in sorted(tags)
+                ),
+                batch_size=self.batch_size,
+            )
+            recipe_ids.extend(recipe.pk for recipe in recipes)
+            self.stdout.write(
+                f'Рецептов: {len(recipe_ids)}', ending='\r'
+            )
+        self.stdout.write('')
+        return recipe_ids
+
+    def get_image(self):
+        """Общая для всех рецептов картинка-заглушка."""
+        if not default_storage.exists(IMAGE_NAME):
+            buffer = io.BytesIO()
+            Image.new('RGB', (600, 400), (230, 220, 200)).save(
+                buffer, 'JPEG'
+            )
+            default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+        return IMAGE_NAME
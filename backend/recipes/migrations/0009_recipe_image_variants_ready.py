@@ -0,0 +1,57 @@
+# Generated by Django 4.2.19 on 2026-10-18 19:29
+
+import os
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+# Копии на момент миграции: имя варианта и расширение, как в api.images.
+VARIANTS = (('card', 'jpg'), ('thumbnail', 'jpg'), ('webp', 'webp'))
+VARIANTS_DIR = 'variants'
+
+
+def has_variants(storage, name):
+    """Лежат ли в хранилище все варианты изображения name."""
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return all(
+        storage.exists(os.path.join(
+            directory, VARIANTS_DIR, f'{stem}_{variant}.{extension}'
+        ))
+        for variant, extension in VARIANTS
+    )
+
+
+def mark_existing_variants(apps, schema_editor):
+    """Отметить рецепты, у которых копии уже лежат в хранилище."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    storage = Recipe._meta.get_field('image').storage
+    ready = [
+        pk
+        for pk, name in Recipe.objects.exclude(image='').values_list(
+            'pk', 'image'
+        ).iterator()
+        if has_variants(storage, name)
+    ]
+    for start in range(0, len(ready), BATCH_SIZE):
+        Recipe.objects.filter(pk__in=ready[start:start + BATCH_SIZE]).update(
+            image_variants_ready=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_author_name_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Уменьшенные копии созданы'),
+        ),
+        migrations.RunPython(
+            mark_existing_variants, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.19 on 2026-10-18 19:53
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_image_variants_ready'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='shoppinglistitem',
+            options={'ordering': ['user_id', 'ingredient_id'], 'verbose_name': 'Позиция списка покупок', 'verbose_name_plural': 'Позиции списка покупок'},
+        ),
+    ]
@@ -1,16 +1,49 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Exists, OuterRef, Prefetch, Value
 
 from foodgram import constants
 from ingredients.models import Ingredient
+from recipes.search import search
 from tags.models import Tag
+from users.models import CountersMixin
 
 User = get_user_model()
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+
+    def search(self, query):
+        """Полнотекстовый поиск с сортировкой по релевантности."""
+        return search(
+            self, query, connections[self.db].vendor
+        ).order_by('-search_rank', 'id')
+
+    def with_user_flags(self, user):
+        """Аннотировать рецепты флагами избранного и списка покупок."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+        )
+
+
+class Recipe(CountersMixin, models.Model):
     """Модель для хранения рецептов."""
 
     name = models.CharField(
@@ -23,6 +56,11 @@ class Recipe(models.Model):
         verbose_name='Автор'
     )
     image = models.ImageField('Изображение', upload_to='recipes/')
+    image_variants_ready = models.BooleanField(
+        'Уменьшенные копии созданы',
+        default=False,
+        editable=False,
+    )
     text = models.TextField('Описание')
     cooking_time = models.PositiveIntegerField(
         'Время приготовления (мин)',
@@ -58,11 +96,31 @@ class Recipe(models.Model):
         related_name='favorite_recipes',
         blank=True,
     )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False,
+    )
+
+    counter_fields = ('favorites_count', 'in_carts_count')
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='recipe_name_id_idx'),
+            models.Index(
+                fields=['author', 'name'], name='recipe_author_name_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -104,12 +162,25 @@ class RecipeIngredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент рецепта'
         verbose_name_plural = 'Ингредиенты рецепта'
-        ordering = ['ingredient__name']
 
     def __str__(self):
         return f'{self.ingredient.name} в {self.recipe.name}'
 
 
+def prefetch_recipe_ingredients():
+    """Ингредиенты рецептов с названиями, по алфавиту.
+
+    Сортировка задаётся здесь, а не в Meta.ordering, чтобы остальные
+    запросы к RecipeIngredient не соединялись с таблицей ингредиентов.
+    """
+    return Prefetch(
+        'recipe_ingredients',
+        queryset=RecipeIngredient.objects.select_related(
+            'ingredient'
+        ).order_by('ingredient__name'),
+    )
+
+
 class ShoppingCart(models.Model):
     """Модель списка покупок пользователя."""
 
@@ -143,6 +214,181 @@ class ShoppingCart(models.Model):
         )
 
 
+def get_recipe_amounts(recipe_id):
+    """Вернуть количество каждого ингредиента в рецепте."""
+    amounts = {}
+    for ingredient_id, amount in RecipeIngredient.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('ingredient_id', 'amount').order_by():
+        amounts[ingredient_id] = amounts.get(ingredient_id, 0) + amount
+    return amounts
+
+
+# Списки покупок пересчитывает сам код, меняющий данные пачкой.
+shopping_list_paused = ContextVar('shopping_list_paused', default=False)
+
+
+def lock_users(user_ids):
+    """Заблокировать строки пользователей до конца транзакции.
+
+    Изменения списков покупок одного пользователя выполняются по очереди:
+    иначе параллельные транзакции не видят вставок друг друга и вторая
+    нарушает unique_user_ingredient_in_shopping_list.
+    """
+    list(
+        User.objects.select_for_update()
+        .filter(pk__in=user_ids)
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+
+
+class ShoppingListItemManager(models.Manager):
+
+    @contextmanager
+    def paused(self):
+        """Не обновлять списки покупок по сигналам внутри блока."""
+        token = shopping_list_paused.set(True)
+        try:
+            yield
+        finally:
+            shopping_list_paused.reset(token)
+
+    def is_paused(self):
+        return shopping_list_paused.get()
+
+    def apply_delta(self, user_ids, delta):
+        """Изменить суммы ингредиентов в списках покупок пользователей."""
+        delta = {
+            ingredient_id: amount
+            for ingredient_id, amount in delta.items() if amount
+        }
+        user_ids = list(user_ids)
+        if not delta or not user_ids:
+            return
+        with transaction.atomic():
+            lock_users(user_ids)
+            to_update, to_delete, existing = [], [], set()
+            for item in self.select_for_update().filter(
+                user_id__in=user_ids, ingredient_id__in=delta
+            ):
+                existing.add((item.user_id, item.ingredient_id))
+                item.total_amount += delta[item.ingredient_id]
+                if item.total_amount > 0:
+                    to_update.append(item)
+                else:
+                    to_delete.append(item.pk)
+            self.bulk_update(to_update, ['total_amount'])
+            self.filter(pk__in=to_delete).delete()
+            self.bulk_create(
+                self.model(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=amount,
+                )
+                for user_id in user_ids
+                for ingredient_id, amount in delta.items()
+                if amount > 0 and (user_id, ingredient_id) not in existing
+            )
+
+    def add_recipe(self, user_id, recipe_id):
+        self.apply_delta([user_id], get_recipe_amounts(recipe_id))
+
+    def remove_recipe(self, user_id, recipe_id):
+        self.apply_delta([user_id], {
+            ingredient_id: -amount
+            for ingredient_id, amount in get_recipe_amounts(recipe_id).items()
+        })
+
+    def change_recipe(self, recipe_id, old_amounts, new_amounts):
+        """Учесть изменение состава рецепта во всех корзинах с ним."""
+        delta = dict.fromkeys({*old_amounts, *new_amounts}, 0)
+        for ingredient_id, amount in new_amounts.items():
+            delta[ingredient_id] += amount
+        for ingredient_id, amount in old_amounts.items():
+            delta[ingredient_id] -= amount
+        self.apply_delta(
+            ShoppingCart.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('user_id', flat=True),
+            delta,
+        )
+
+    def rebuild(self, user_ids=None):
+        """Пересчитать списки покупок заново по содержимому корзин."""
+        carts = ShoppingCart.objects.all()
+        items = self.all()
+        if user_ids is not None:
+            carts = carts.filter(user_id__in=user_ids)
+            items = items.filter(user_id__in=user_ids)
+        totals = carts.values(
+            'user_id', 'recipe__recipe_ingredients__ingredient_id'
+        ).annotate(
+            total_amount=models.Sum('recipe__recipe_ingredients__amount')
+        ).filter(total_amount__gt=0).order_by()
+        with transaction.atomic():
+            if user_ids is not None:
+                lock_users(user_ids)
+            items.delete()
+            self.bulk_create(
+                (
+                    self.model(
+                        user_id=total['user_id'],
+                        ingredient_id=total[
+                            'recipe__recipe_ingredients__ingredient_id'
+                        ],
+                        total_amount=total['total_amount'],
+                    )
+                    for total in totals.iterator()
+                ),
+                batch_size=1000,
+            )
+
+
+class ShoppingListItem(models.Model):
+    """Сводная позиция списка покупок пользователя.
+
+    Суммы обновляются сигналами при добавлении рецептов в корзину,
+    удалении из неё и изменении состава рецептов, лежащих в корзинах,
+    откуда бы ни шло изменение: API, админка или каскадное удаление.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='in_shopping_lists',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.PositiveIntegerField('Количество')
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+        # Только свои столбцы: порядок по названию ингредиента добавил бы
+        # соединение к каждому запросу, он задаётся там, где нужен.
+        ordering = ['user_id', 'ingredient_id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_user_ingredient_in_shopping_list'
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f'{self.ingredient.name} - {self.total_amount} '
+            f'в списке покупок у {self.user.username}'
+        )
+
+
 class Favorite(models.Model):
     """Модель избранных рецептов пользователя."""
 
@@ -0,0 +1,154 @@
+"""Полнотекстовый поиск рецептов по названию и описанию.
+
+На PostgreSQL у таблицы рецептов есть генерируемый столбец search_vector
+с GIN-индексом, на SQLite — внешняя FTS5-таблица, которую поддерживают
+триггеры. Django об этих объектах не знает: они создаются миграцией
+и проверяются после каждого migrate, потому что SQLite при перестройке
+таблицы удаляет её триггеры.
+"""
+import re
+
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from foodgram.constants import RECIPE_SEARCH_CONFIG
+
+FTS_TABLE = 'recipes_recipe_fts'
+
+POSTGRESQL_INSTALL = (
+    f"""
+    ALTER TABLE recipes_recipe
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(
+            to_tsvector('{RECIPE_SEARCH_CONFIG}', coalesce(name, '')), 'A'
+        )
+        || setweight(
+            to_tsvector('{RECIPE_SEARCH_CONFIG}', coalesce(text, '')), 'B'
+        )
+    ) STORED
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS recipe_search_vector_idx
+    ON recipes_recipe USING GIN (search_vector)
+    """,
+)
+POSTGRESQL_UNINSTALL = (
+    'DROP INDEX IF EXISTS recipe_search_vector_idx',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+)
+
+SQLITE_TABLE = f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        name, text,
+        content='recipes_recipe', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+"""
+SQLITE_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+)
+SQLITE_UNINSTALL = (
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+)
+
+
+def install_search_index(connection):
+    """Создать поисковый индекс, если его ещё нет."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for sql in POSTGRESQL_INSTALL:
+                cursor.execute(sql)
+        elif connection.vendor == 'sqlite':
+            if FTS_TABLE not in connection.introspection.table_names(cursor):
+                cursor.execute(SQLITE_TABLE)
+                cursor.execute(
+                    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+                )
+            for sql in SQLITE_TRIGGERS:
+                cursor.execute(sql)
+
+
+def uninstall_search_index(connection):
+    statements = {
+        'postgresql': POSTGRESQL_UNINSTALL,
+        'sqlite': SQLITE_UNINSTALL,
+    }.get(connection.vendor, ())
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def get_match_query(query):
+    """Запрос FTS5: все слова обязательны, каждое ищется как префикс."""
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', query))
+
+
+def search(queryset, query, vendor):
+    """Отфильтровать рецепты по запросу и аннотировать их search_rank.
+
+    Чем больше search_rank, тем выше рецепт в выдаче.
+    """
+    if vendor == 'postgresql':
+        tsquery = 'websearch_to_tsquery(%s::regconfig, %s)'
+        params = (RECIPE_SEARCH_CONFIG, query)
+        return queryset.annotate(
+            search_rank=RawSQL(
+                f'ts_rank(recipes_recipe.search_vector, {tsquery})',
+                params,
+                output_field=FloatField(),
+            ),
+        ).filter(
+            RawSQL(
+                f'recipes_recipe.search_vector @@ {tsquery}',
+                params,
+                output_field=BooleanField(),
+            )
+        )
+    if vendor == 'sqlite':
+        match = get_match_query(query)
+        if not match:
+            return queryset.annotate(search_rank=Value(0.0)).none()
+        # FTS-таблица присоединяется к рецептам, чтобы MATCH выполнялся
+        # один раз, а bm25 считался по найденной строке. Коррелированный
+        # подзапрос повторял бы полнотекстовый поиск для каждого рецепта.
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[
+                f'{FTS_TABLE}.rowid = recipes_recipe.id',
+                f'{FTS_TABLE} MATCH %s',
+            ],
+            params=[match],
+        ).annotate(
+            search_rank=RawSQL(
+                f'-bm25({FTS_TABLE}, 10.0, 1.0)', (), output_field=FloatField()
+            ),
+        )
+    return queryset.annotate(
+        search_rank=Value(0.0),
+    ).filter(Q(name__icontains=query) | Q(text__icontains=query))
@@ -0,0 +1,151 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F, QuerySet
+from django.db.models.functions import Greatest
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from ingredients.models import Ingredient
+from recipes.models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                            ShoppingListItem, get_recipe_amounts)
+
+User = get_user_model()
+
+
+def change_counter(model, pk, field, step):
+    """Сдвигает счётчик, не опуская его ниже нуля."""
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + step, 0)}
+    )
+
+
+def is_deleting(origin, model):
+    """Запущено ли каскадное удаление с объектов model.
+
+    Счётчики удаляемых объектов обновлять незачем.
+    """
+    return isinstance(origin, model) or (
+        isinstance(origin, QuerySet) and origin.model is model
+    )
+
+
+def is_cascade_from(origin, *models):
+    return any(is_deleting(origin, model) for model in models)
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(instance, origin=None, **kwargs):
+    if not is_deleting(origin, User):
+        change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Favorite)
+def increment_favorites_count(instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def decrement_favorites_count(instance, origin=None, **kwargs):
+    if not is_deleting(origin, Recipe):
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def increment_in_carts_count(instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'in_carts_count', 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_in_carts_count(instance, origin=None, **kwargs):
+    if not is_deleting(origin, Recipe):
+        change_counter(Recipe, instance.recipe_id, 'in_carts_count', -1)
+
+
+@receiver(pre_save, sender=ShoppingCart)
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_previous(sender, instance, **kwargs):
+    """Запомнить строку до изменения, чтобы вычесть её из списков покупок.
+
+    Существующие строки корзин и состава рецептов меняет только админка.
+    """
+    instance.previous = None
+    if instance.pk is not None and not ShoppingListItem.objects.is_paused():
+        instance.previous = sender.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(instance, created, **kwargs):
+    previous = getattr(instance, 'previous', None)
+    if ShoppingListItem.objects.is_paused():
+        return
+    if previous is not None:
+        if (previous.user_id, previous.recipe_id) == (
+            instance.user_id, instance.recipe_id
+        ):
+            return
+        ShoppingListItem.objects.remove_recipe(
+            previous.user_id, previous.recipe_id
+        )
+    elif not created:
+        return
+    ShoppingListItem.objects.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_list(instance, origin=None, **kwargs):
+    # Корзины удаляемого рецепта учитывает subtract_deleted_recipe,
+    # а списки удаляемого пользователя удаляются вместе с ним.
+    if not ShoppingListItem.objects.is_paused() and not is_cascade_from(
+        origin, Recipe, User
+    ):
+        ShoppingListItem.objects.remove_recipe(
+            instance.user_id, instance.recipe_id
+        )
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def add_recipe_ingredient(instance, created, **kwargs):
+    previous = getattr(instance, 'previous', None)
+    if ShoppingListItem.objects.is_paused() or not (created or previous):
+        return
+    old_amounts = {}
+    if previous is not None:
+        old_amounts = {previous.ingredient_id: previous.amount}
+        if previous.recipe_id != instance.recipe_id:
+            ShoppingListItem.objects.change_recipe(
+                previous.recipe_id, old_amounts, {}
+            )
+            old_amounts = {}
+    ShoppingListItem.objects.change_recipe(
+        instance.recipe_id,
+        old_amounts,
+        {instance.ingredient_id: instance.amount},
+    )
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def remove_recipe_ingredient(instance, origin=None, **kwargs):
+    # Позиции удаляемого ингредиента удаляются вместе с ним.
+    if not ShoppingListItem.objects.is_paused() and not is_cascade_from(
+        origin, Recipe, User, Ingredient
+    ):
+        ShoppingListItem.objects.change_recipe(
+            instance.recipe_id, {instance.ingredient_id: instance.amount}, {}
+        )
+
+
+@receiver(pre_delete, sender=Recipe)
+def subtract_deleted_recipe(instance, **kwargs):
+    """Убрать рецепт из списков покупок, пока его корзины и состав целы."""
+    if not ShoppingListItem.objects.is_paused():
+        ShoppingListItem.objects.change_recipe(
+            instance.id, get_recipe_amounts(instance.id), {}
+        )
@@ -5,11 +5,35 @@ from django.db import models
 from foodgram import constants
 
 
-class User(AbstractUser):
+class CountersMixin:
+    """Счётчики, которые меняются только через F-выражения.
+
+    Полное сохранение объекта из памяти не перезаписывает их устаревшими
+    значениями: поля из counter_fields пишутся, только если они явно
+    названы в update_fields.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not (
+            self._state.adding or args or kwargs.get('force_insert')
+            or kwargs.get('update_fields') is not None
+        ):
+            skipped = {*self.counter_fields, *self.get_deferred_fields()}
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
     """Модель пользователя."""
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
+    counter_fields = ('recipes_count',)
 
     first_name = models.CharField(
         verbose_name='Имя',
@@ -36,6 +60,16 @@ class User(AbstractUser):
         upload_to='avatars/',
         blank=True,
     )
+    avatar_variants_ready = models.BooleanField(
+        'Уменьшенные копии созданы',
+        default=False,
+        editable=False,
+    )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('username',)